@@ -0,0 +1,148 @@
+"""
+In-process benchmarks for factored.
+
+The validator and authenticator apps are driven with raw WSGI calls, so the
+numbers reflect the time spent in factored (and pyramid) rather than in a
+server or the network. See "python -m benchmarks --help".
+"""
+import gc
+import sys
+import time
+import tracemalloc
+from urllib.parse import urlencode
+
+from webob import Request
+
+
+def make_environ(path="/", host="localhost", cookies=None, params=None, method="GET"):
+    """
+    Keyword Arguments:
+    path -- path of the request
+    host -- value of the Host header
+    cookies -- dict of cookies to send
+    params -- dict of GET (or POST) params
+    method -- "GET" or "POST"
+
+    Returns:
+    a WSGI environ dict for the request, copy it before each use
+    """
+    kwargs = dict(headers={"Host": host})
+    if params:
+        if method == "POST":
+            kwargs["POST"] = params
+        else:
+            path = "{}?{}".format(path, urlencode(params))
+    req = Request.blank(path, **kwargs)
+    if cookies:
+        req.headers["Cookie"] = "; ".join("{}={}".format(k, v) for k, v in cookies.items())
+    return req.environ
+
+
+def initialize_plugins(app, categories):
+    """
+    The apps don't initialize the configured plugins themselves, so do it the
+    same way the tests do.
+
+    Arguments:
+    app -- the WSGI app returned by one of the app factories
+    categories -- list of (name setting, category), IE ("plugins.finder", "finder")
+    """
+    settings = app.registry.settings
+    resolver = settings["plugins.resolver"]
+    for name_setting, category in categories:
+        plugin, plugin_settings = resolver.get_plugin(name_setting, category, settings)
+        plugin.plugin_object.initialize(plugin_settings)
+
+
+def call(app, environ):
+    """
+    Arguments:
+    app -- the WSGI app
+    environ -- the environ to call it with, copied before use
+
+    Returns:
+    the status code of the response
+    """
+    status = []
+
+    def start_response(s, headers, exc_info=None):
+        status.append(s)
+
+    body = app(dict(environ), start_response)
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+    return int(status[0].split(" ", 1)[0])
+
+
+def run(app, environs, warmup=100):
+    """
+    Arguments:
+    app -- the WSGI app
+    environs -- list of (label, environ) to call the app with, in order
+
+    Keyword Arguments:
+    warmup -- number of requests to make before measuring
+
+    Returns:
+    dict of results, see report()
+    """
+    for _, environ in environs[:warmup]:
+        call(app, environ)
+
+    statuses = {}
+    latencies = []
+    gc.collect()
+    start = time.perf_counter()
+    for label, environ in environs:
+        t0 = time.perf_counter()
+        status = call(app, environ)
+        latencies.append(time.perf_counter() - t0)
+        key = (label, status)
+        statuses[key] = statuses.get(key, 0) + 1
+    elapsed = time.perf_counter() - start
+
+    # memory is measured on a separate pass, tracing slows everything down
+    sample = environs[:min(len(environs), 200)]
+    blocks = sys.getallocatedblocks()
+    peaks = []
+    tracemalloc.start()
+    for _, environ in sample:
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        call(app, environ)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    gc.collect()
+    retained = (sys.getallocatedblocks() - blocks) / float(len(sample))
+
+    latencies.sort()
+    return dict(
+        requests=len(environs),
+        rps=len(environs) / elapsed,
+        p50=latencies[len(latencies) // 2],
+        p99=latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        peak_kib=sum(peaks) / float(len(peaks)) / 1024,
+        retained_blocks=retained,
+        statuses=statuses)
+
+
+def report(name, results, out=sys.stdout):
+    """
+    Arguments:
+    name -- name of the benchmark
+    results -- dict returned by run()
+    """
+    out.write("{}\n".format(name))
+    out.write("  requests        {:>10}\n".format(results["requests"]))
+    out.write("  requests/sec    {:>10.0f}\n".format(results["rps"]))
+    out.write("  p50 latency     {:>10.1f} us\n".format(results["p50"] * 1e6))
+    out.write("  p99 latency     {:>10.1f} us\n".format(results["p99"] * 1e6))
+    out.write("  peak memory/req {:>10.1f} KiB\n".format(results["peak_kib"]))
+    out.write("  retained/req    {:>10.2f} blocks\n".format(results["retained_blocks"]))
+    for (label, status), count in sorted(results["statuses"].items()):
+        out.write("  {:<15} {:>10} x {}\n".format(label, count, status))
@@ -0,0 +1,57 @@
+import argparse
+import logging
+
+from benchmarks import report, run
+import benchmarks.authenticator
+import benchmarks.validator
+
+APPS = {
+    "validator": benchmarks.validator,
+    "authenticator": benchmarks.authenticator,
+}
+
+
+def parse_mix(value):
+    mix = []
+    for part in value.split(","):
+        label, weight = part.split("=")
+        mix.append((label.strip(), int(weight)))
+    return tuple(mix)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="in-process throughput benchmarks for the factored apps")
+    parser.add_argument("apps", nargs="*", default=[],
+                        help="apps to benchmark, all of them by default")
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="number of requests to make per app")
+    parser.add_argument("--users", type=int, default=100,
+                        help="number of distinct users/tokens per kind of request")
+    parser.add_argument("--hosts", type=int, default=3,
+                        help="number of distinct Host headers")
+    parser.add_argument("--mix", type=parse_mix, default=None,
+                        help="weights per kind of request, IE valid=80,expired=20")
+    parser.add_argument("--setting", action="append", default=[],
+                        help="extra app setting as key=value, may be repeated")
+    args = parser.parse_args()
+
+    # the audit log would otherwise dominate the numbers
+    logging.disable(logging.CRITICAL)
+
+    overrides = dict(s.split("=", 1) for s in args.setting)
+    unknown = set(args.apps) - set(APPS)
+    if unknown:
+        parser.error("unknown apps: {}".format(", ".join(sorted(unknown))))
+    for name in args.apps or sorted(APPS):
+        module = APPS[name]
+        kwargs = dict(users=args.users, hosts=args.hosts)
+        if args.mix is not None:
+            kwargs["mix"] = args.mix
+        environs = module.make_environs(args.requests, **kwargs)
+        report(name, run(module.make_app(**overrides), environs))
+
+
+if __name__ == "__main__":
+    main()
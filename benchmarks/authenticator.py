@@ -0,0 +1,77 @@
+"""
+Drives factored.authenticator.app through the screens a user sees before
+a code is sent: the auth options, the email entry form and a code
+submission without an outstanding access request.
+"""
+import random
+
+from benchmarks import initialize_plugins, make_environ
+
+SETTINGS = {
+    "jwt.audience": "urn:factored",
+    "jwt.algorithm": "HS512",
+    "jwt.secret": "benchmarksecret-" * 4,
+    "plugins.template": "DefaultTemplate",
+    "plugins.datastore": "MemDataStore",
+    "plugins.finder": "EMailDomain",
+    "plugins.settings": "DefaultSettings",
+    "plugin.EMailDomain.valid_domains": "wildcardcorp.com\nassemblys.net",
+    "plugin.EMailAuth.code_hash_salt": "benchmarksalt",
+}
+
+# (label, weight)
+DEFAULT_MIX = (
+    ("options", 40),
+    ("emailform", 40),
+    ("code", 20),
+)
+
+
+def make_app(**overrides):
+    from factored.authenticator import app
+
+    settings = dict(SETTINGS)
+    settings.update(overrides)
+    application = app({}, **settings)
+    initialize_plugins(application, [
+        ("plugins.datastore", "datastore"),
+        ("plugins.finder", "finder"),
+    ])
+    return application
+
+
+def make_environs(count, users=100, hosts=3, mix=DEFAULT_MIX, seed=0):
+    """
+    Keyword Arguments:
+    users -- number of distinct email addresses
+    hosts -- number of distinct Host headers
+    mix -- sequence of (label, weight)
+
+    Returns:
+    list of count (label, environ) tuples
+    """
+    rnd = random.Random(seed)
+    labels = [label for label, _ in mix]
+    weights = [weight for _, weight in mix]
+    environs = []
+    for label in rnd.choices(labels, weights=weights, k=count):
+        src = "https://site.example.com/page{}".format(rnd.randrange(1000))
+        if label == "options":
+            params = {"src": src}
+        elif label == "emailform":
+            params = {"src": src, "submit": "authtype_EMailAuth"}
+        else:
+            params = {
+                "src": src,
+                "authtype": "EMailAuth",
+                "submit": "code",
+                "email": "user{}@wildcardcorp.com".format(rnd.randrange(users)),
+                "code": "000000",
+            }
+        environ = make_environ(
+            path="/",
+            host="site{}.example.com".format(rnd.randrange(hosts)),
+            params=params,
+            method="POST" if label == "code" else "GET")
+        environs.append((label, environ))
+    return environs
@@ -0,0 +1,40 @@
+"""
+Benchmarks the EMailAuth code hash schemes, the cost of hashing is paid
+once when a code is sent and again on every attempt to enter it.
+
+usage: python -m benchmarks.codehash [--number 20]
+"""
+import argparse
+import timeit
+
+from factored.plugins import get_manager
+
+
+SCHEMES = [
+    ("pbkdf2 (legacy)", {}),
+    ("pbkdf2 10000", {"code_hash.iterations": "10000"}),
+    ("scrypt n=16384", {"code_hash.scheme": "scrypt"}),
+    ("scrypt n=1024", {"code_hash.scheme": "scrypt", "code_hash.scrypt_n": "1024"}),
+    ("hmac sha256", {"code_hash.scheme": "hmac", "code_hash.secret": "benchmarksecret"}),
+]
+
+
+def run(number):
+    auth = get_manager().getPluginByName("EMailAuth", category="authenticator").plugin_object
+    print("{:>16} {:>12} {:>12}".format("scheme", "hash us", "check us"))
+    for name, settings in SCHEMES:
+        payload = auth.get_code_hash(settings, "abc123")
+        hashing = timeit.timeit(lambda: auth.get_code_hash(settings, "abc123"), number=number)
+        checking = timeit.timeit(lambda: auth.check_code_hash(settings, "abc124", payload), number=number)
+        print("{:>16} {:>12.1f} {:>12.1f}".format(name, hashing / number * 1e6, checking / number * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+    run(args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Benchmarks EMailDomain.is_valid_subject against growing valid_domains lists,
+half exact entries and half wildcards, to show that the cost of a check
+doesn't depend on the number of configured domains.
+
+usage: python -m benchmarks.emaildomain [--sizes 100,10000,100000] [--number 100000]
+"""
+import argparse
+import random
+import string
+import timeit
+
+from factored.plugins import get_manager
+
+
+def random_domain(rnd):
+    label = "".join(rnd.choice(string.ascii_lowercase) for _ in range(10))
+    return "{}.{}".format(label, rnd.choice(["com", "net", "org", "io"]))
+
+
+def make_finder(size, rnd):
+    domains = [random_domain(rnd) for _ in range(size)]
+    entries = [d if i % 2 == 0 else "*." + d for i, d in enumerate(domains)]
+    finder = get_manager().getPluginByName("EMailDomain", category="finder").plugin_object
+    finder.initialize({"valid_domains": "\n".join(entries)})
+    return finder, domains
+
+
+def run(sizes, number):
+    rnd = random.Random(0)
+    print("{:>10} {:>12} {:>12} {:>12}".format("domains", "exact ns", "wildcard ns", "miss ns"))
+    for size in sizes:
+        finder, domains = make_finder(size, rnd)
+        exact = "user@" + domains[-2 if size > 1 else 0]
+        wildcard = "user@mail." + domains[-1]
+        miss = "user@mail.notconfigured.example"
+        results = []
+        for sub in (exact, wildcard, miss):
+            elapsed = timeit.timeit(lambda: finder.is_valid_subject("host", sub), number=number)
+            results.append(elapsed / number * 1e9)
+        print("{:>10} {:>12.0f} {:>12.0f} {:>12.0f}".format(size, *results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="100,10000,100000")
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+    run([int(s) for s in args.sizes.split(",")], args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmarks SQLDataStore.get_access_request and store_access_request against
+an SQLite database with many stored access requests, with the access_requests
+indexes, with hashed lookup keys, and without any indexes (the schema before
+they were added).
+
+usage: python -m benchmarks.sqldatastore [--rows 1000000] [--number 1000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import timeit
+
+from sqlalchemy import insert, inspect, text
+
+from factored.plugins import get_manager
+from factored.plugins.defaults.datastores.SQLDataStore import AccessRequest, lookup_key
+
+
+def fill(ds, rows, hosts, batch=10000):
+    table = AccessRequest.__table__
+    with ds.dbengine.begin() as conn:
+        for start in range(0, rows, batch):
+            conn.execute(insert(table), [
+                {
+                    "host": hosts[i % len(hosts)],
+                    "subject": "user{}@example.com".format(i),
+                    "timestamp": float(i),
+                    "payload": "pbkdf2$100000${:064x}".format(i),
+                    "lookup_key": lookup_key(hosts[i % len(hosts)], "user{}@example.com".format(i)),
+                }
+                for i in range(start, min(start + batch, rows))])
+
+
+def time_lookups(ds, rows, hosts, number, rnd):
+    keys = [rnd.randrange(rows) for _ in range(number)]
+    it = iter(keys)
+
+    def lookup():
+        i = next(it)
+        assert ds.get_access_request(hosts[i % len(hosts)], "user{}@example.com".format(i)) is not None
+
+    return timeit.timeit(lookup, number=number) / number * 1e6
+
+
+def time_stores(ds, rows, hosts, number, rnd):
+    keys = [rnd.randrange(rows) for _ in range(number)]
+    it = iter(keys)
+
+    def store():
+        i = next(it)
+        ds.store_access_request(hosts[i % len(hosts)], "user{}@example.com".format(i), float(i), "code")
+
+    return timeit.timeit(store, number=number) / number * 1e6
+
+
+def report(name, ds, rows, hosts, number, rnd):
+    print("{:>12} {:>12.1f} {:>12.1f}".format(
+        name, time_lookups(ds, rows, hosts, number, rnd), time_stores(ds, rows, hosts, number, rnd)))
+
+
+def run(rows, number, unindexed_number):
+    rnd = random.Random(0)
+    hosts = ["host{}.example.com".format(i) for i in range(10)]
+    ds = get_manager().getPluginByName("SQLDataStore", category="datastore").plugin_object
+    with tempfile.TemporaryDirectory() as tmpdir:
+        url = "sqlite:///" + os.path.join(tmpdir, "db.sqlite")
+        ds.initialize({"sql.url": url})
+        fill(ds, rows, hosts)
+        print("{} rows".format(rows))
+        print("{:>12} {:>12} {:>12}".format("schema", "lookup us", "store us"))
+        report("indexed", ds, rows, hosts, number, rnd)
+
+        ds.dbengine.dispose()
+        ds.initialize({"sql.url": url, "hashed_keys": "true"})
+        report("hashed", ds, rows, hosts, number, rnd)
+
+        # without the unique index, stores can't be upserts
+        with ds.dbengine.begin() as conn:
+            for index in inspect(ds.dbengine).get_indexes(AccessRequest.__table__.name):
+                conn.execute(text("DROP INDEX {}".format(index["name"])))
+        ds.hashed_keys = False
+        print("{:>12} {:>12.1f}".format("unindexed", time_lookups(ds, rows, hosts, unindexed_number, rnd)))
+        ds.dbengine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--number", type=int, default=1000)
+    parser.add_argument("--unindexed-number", type=int, default=20,
+                        help="lookups without indexes, each one scans the table")
+    args = parser.parse_args()
+    run(args.rows, args.number, args.unindexed_number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Drives factored.validator.app the way nginx's access_by_lua does: one
+request per proxied request, with the token in a cookie.
+
+The mix of tokens is configurable, the defaults roughly match a site where
+most requests come from logged in users fetching assets.
+"""
+from datetime import datetime, timedelta
+import random
+
+import jwt
+
+from benchmarks import initialize_plugins, make_environ
+
+SECRET = "benchmarksecret-" * 4
+SETTINGS = {
+    "jwt.audience": "urn:factored",
+    "jwt.algorithm": "HS512",
+    "jwt.secret": SECRET,
+    "jwt.cookie.name": "factored",
+    "plugins.finder": "EMailDomain",
+    "plugins.settings": "DefaultSettings",
+    "plugin.EMailDomain.valid_domains": "wildcardcorp.com\nassemblys.net",
+}
+
+# (label, weight)
+DEFAULT_MIX = (
+    ("valid", 80),
+    ("expired", 5),
+    ("badsignature", 5),
+    ("unknownsubject", 5),
+    ("garbage", 5),
+)
+
+
+def make_app(**overrides):
+    from factored.validator import app
+
+    settings = dict(SETTINGS)
+    settings.update(overrides)
+    application = app({}, **settings)
+    initialize_plugins(application, [("plugins.finder", "finder")])
+    return application
+
+
+def make_token(subject, secret=SECRET, expired=False):
+    exp = datetime.utcnow() + timedelta(days=-1 if expired else 1)
+    return jwt.encode(
+        {"sub": subject, "exp": exp, "aud": "urn:factored"},
+        secret,
+        algorithm="HS512")
+
+
+def make_tokens(rnd, users):
+    """
+    Returns:
+    dict of label to a list of tokens for that label
+    """
+    tokens = {
+        "valid": [make_token("user{}@wildcardcorp.com".format(i)) for i in range(users)],
+        "expired": [make_token("user{}@wildcardcorp.com".format(i), expired=True) for i in range(users)],
+        "badsignature": [make_token("user{}@wildcardcorp.com".format(i), secret="wrong" * 16)
+                         for i in range(users)],
+        "unknownsubject": [make_token("user{}@example.com".format(i)) for i in range(users)],
+        "garbage": ["garbage{}".format(rnd.random()) for _ in range(users)],
+    }
+    return {k: [t.decode("utf-8") if isinstance(t, bytes) else t for t in v]
+            for k, v in tokens.items()}
+
+
+def make_environs(count, users=100, hosts=3, mix=DEFAULT_MIX, seed=0):
+    """
+    Keyword Arguments:
+    users -- number of distinct tokens per label
+    hosts -- number of distinct Host headers
+    mix -- sequence of (label, weight)
+
+    Returns:
+    list of count (label, environ) tuples
+    """
+    rnd = random.Random(seed)
+    tokens = make_tokens(rnd, users)
+    labels = [label for label, _ in mix]
+    weights = [weight for _, weight in mix]
+    environs = []
+    for label in rnd.choices(labels, weights=weights, k=count):
+        environ = make_environ(
+            path="/",
+            host="site{}.example.com".format(rnd.randrange(hosts)),
+            cookies={"factored": rnd.choice(tokens[label])})
+        environs.append((label, environ))
+    return environs
@@ -1,5 +1,7 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from urllib.parse import urlparse, urlunparse
+import threading
+from urllib.parse import urlencode, urlparse, urlunparse
 
 import jinja2
 import jwt
@@ -8,12 +10,27 @@ from pyramid.config import Configurator
 from pyramid.response import Response
 from pyramid.view import view_config
 
-from factored.plugins import get_manager, get_plugin
+from factored.authenticator.assets import ASSET_PARAM, get_static_assets
+from factored.authenticator.pages import get_page_cache
+from factored.authenticator.sweeper import get_sweeper
+from factored.mail import delivery_status
+from factored.plugins import ExecutorBusy, get_manager, get_resolver, PluginResolver
 
 import logging
 logger = logging.getLogger('factored.authenticator')
 
 
+# pages of requests with only these params don't depend on anything the user
+# entered, so they can be rendered once and cached (see PageCache)
+STATELESS_PARAMS = frozenset(["src", "submit", "authtype"])
+
+# the status of a code sent in the background is polled with this param
+DELIVERY_PARAM = "factored_delivery"
+
+# shown when a plugin's work is refused because the server is too busy
+BUSY_MESSAGE = "The server is busy right now. Please try again in a moment."
+
+
 def generate_jwt(settings, subject, extra_info=None):
     cname = settings.get("jwt.cookie.name", "factored")
     try:
@@ -59,6 +76,122 @@ def get_authtype(req):
     return auth_type
 
 
+class TemplateCache(object):
+    """
+    TemplateCache holds the compiled templates for each combination of
+    ITemplatePlugin base template and (optional) authenticator or
+    registration plugin template, so that the templates are parsed and
+    compiled only once rather than per request.
+
+    Compiled templates are keyed by the plugin names and the hashes of the
+    template sources. At most max_size combinations are kept, IE if plugins
+    generate their template source per request, and the least recently used
+    is dropped to make room. Each combination has its own jinja2 Environment
+    holding its sources, so a template dropped while it's being rendered can
+    still find the "base.html" it extends.
+    """
+    def __init__(self, max_size=100):
+        self.max_size = max_size
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compile(self, base_src, name="base.html", src=None):
+        """
+        Arguments:
+        base_src -- the jinja2 source of the base template, AKA "base.html"
+
+        Keyword Arguments:
+        name -- name of the template to compile, IE "authtype.html"
+        src -- jinja2 source of the (non base) template
+
+        Returns:
+        the compiled jinja2.Template for name
+        """
+        sources = {"base.html": base_src}
+        if src is not None:
+            sources[name] = src
+        environment = jinja2.Environment(
+            loader=jinja2.DictLoader(sources),
+            autoescape=jinja2.select_autoescape(['html', 'xml']),
+            auto_reload=False)
+        return environment.get_template(name)
+
+    def get_template(self, base_plugin, base_src, name="base.html", plugin=None, src=None):
+        """
+        Arguments:
+        base_plugin -- name of the ITemplatePlugin
+        base_src -- the jinja2 source of the base template, AKA "base.html"
+
+        Keyword Arguments:
+        name -- name of the template to render, IE "authtype.html"
+        plugin -- name of the plugin the (non base) template is from
+        src -- jinja2 source of the (non base) template
+
+        Returns:
+        the compiled jinja2.Template for name
+        """
+        key = (base_plugin, hash(base_src), name, plugin, hash(src))
+        with self._lock:
+            entry = self._templates.get(key, None)
+            if entry is not None and entry[0] == base_src and entry[1] == src:
+                self._templates.move_to_end(key)
+                return entry[2]
+
+        template = self.compile(base_src, name, src)
+        with self._lock:
+            self._templates[key] = (base_src, src, template)
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+        return template
+
+    def precompile(self, plugin_manager):
+        """
+        Compiles the templates of all the template, authenticator and
+        registration plugins ahead of time. Plugins whose templates depend on
+        the request can't be compiled this way, and are compiled on first use.
+
+        Arguments:
+        plugin_manager -- the app's PluginManager
+        """
+        authenticators = plugin_manager.getPluginsOfCategory("authenticator")
+        auth_options = [dict(value=a.name, display=a.plugin_object.display_name)
+                        for a in authenticators]
+        children = [("authtype.html", a) for a in authenticators]
+        children += [("registration.html", r)
+                     for r in plugin_manager.getPluginsOfCategory("registrar")]
+        for base in plugin_manager.getPluginsOfCategory("template"):
+            try:
+                base_src = base.plugin_object.template({}, auth_options)
+                self.get_template(base.name, base_src)
+            except Exception:
+                logger.debug("couldn't precompile {}".format(base.name), exc_info=True)
+                continue
+            for name, child in children:
+                try:
+                    src = child.plugin_object.template(None, {}, {})
+                    self.get_template(base.name, base_src, name, child.name, src)
+                except Exception:
+                    logger.debug("couldn't precompile {}".format(child.name), exc_info=True)
+
+
+def get_template_cache(settings):
+    """
+    Arguments:
+    settings -- the app settings
+
+    Returns:
+    the TemplateCache of the app, created and stored as
+    "authenticator.template_cache" in settings if the app didn't already set
+    one up
+    """
+    cache = settings.get("authenticator.template_cache", None)
+    if cache is None:
+        cache = TemplateCache()
+        settings["authenticator.template_cache"] = cache
+    return cache
+
+
 @view_config(route_name='authenticate')
 def authenticate(req):
     host = req.domain
@@ -68,17 +201,38 @@ def authenticate(req):
         logger.error("plugin manager not configured")
         return Response(status_code=500)
 
-    sp, sp_settings = get_plugin("plugins.settings", "settings", reqsettings, plugins)
+    resolver = get_resolver(reqsettings)
+    sp, sp_settings = resolver.get_plugin("plugins.settings", "settings", reqsettings)
 
-    settings = {}
-    settings.update(req.registry.settings)
+    request_settings = {}
     if sp is not None:
-        settings.update(sp.plugin_object.get_request_settings(host))
-
-    ds, ds_settings = get_plugin("plugins.datastore", "datastore", settings, plugins)
-    finder, finder_settings = get_plugin("plugins.finder", "finder", settings, plugins)
-    template, template_settings = get_plugin("plugins.template", "template", settings, plugins)
-    registrar, registrar_settings = get_plugin("plugins.registrar", "registrar", settings, plugins)
+        request_settings = resolver.get_request_settings(sp, host)
+    settings = resolver.settings.layer(request_settings)
+    resolver.track(host, settings)
+
+    ds, ds_settings = resolver.get_plugin("plugins.datastore", "datastore", settings)
+    finder, finder_settings = resolver.get_plugin("plugins.finder", "finder", settings)
+    template, template_settings = resolver.get_plugin("plugins.template", "template", settings)
+    registrar, registrar_settings = resolver.get_plugin("plugins.registrar", "registrar", settings)
+
+    # serve the static assets of the template plugin, IE css
+    asset_name = req.params.get(ASSET_PARAM, None)
+    if asset_name is not None:
+        asset = None
+        if template is not None:
+            asset = get_static_assets(reqsettings).get(template).get(asset_name, None)
+        if asset is None:
+            return Response(status=404)
+        return asset.response(req)
+
+    # report the status of a message sent in the background
+    delivery_id = req.params.get(DELIVERY_PARAM, None)
+    if delivery_id is not None:
+        resp = Response(
+            json_body={"status": delivery_status(delivery_id) or "unknown"},
+            status=200)
+        resp.cache_control = "no-store"
+        return resp
 
     # get db
     if ds is None:
@@ -92,7 +246,7 @@ def authenticate(req):
         logger.error("finder not configured")
         return Response(status_code=500)
     else:
-        finder = finder.plugin_object
+        finder = resolver.get_finder(finder, finder_settings)
 
     auth_type = get_authtype(req)
 
@@ -111,14 +265,11 @@ def authenticate(req):
     base_tmpl_state = base_tmpl_plugin.plugin_object.state(host, base_tmpl_settings, req.params)
     base_tmpl_str = base_tmpl_plugin.plugin_object.template(base_tmpl_state, auth_options)
 
-    # setup the jinja2 loader with the configured template info
-    loader = {
-        "base.html": base_tmpl_str,
-    }
     tmpl_kwargs = {
         "state": base_tmpl_state,
         "auth_options": auth_options,
         "src": req.params.get("src", ""),
+        "assets": get_static_assets(reqsettings).urls(base_tmpl_plugin),
     }
     if auth_type is not None:
         tmpl_kwargs["authtype"] = auth_type
@@ -126,31 +277,48 @@ def authenticate(req):
     # if we have a valid auth type selected by the user, then get it's
     # configured template info too
     tmpl = "base.html"
+    tmpl_plugin = None
+    tmpl_str = None
+    status = 200
     if auth_type is not None and auth_type == "regform":
         if registrar is not None:
-            registrar_tmpl_kwargs = registrar.plugin_object.handle(
-                host,
-                registrar_settings,
-                req.params,
-                ds,
-                finder)
+            try:
+                registrar_tmpl_kwargs = registrar.plugin_object.handle(
+                    host,
+                    registrar_settings,
+                    req.params,
+                    ds,
+                    finder)
+            except ExecutorBusy:
+                logger.warning("{} is too busy".format(registrar.name), exc_info=True)
+                registrar_tmpl_kwargs = {"err": BUSY_MESSAGE}
+                status = 503
             tmpl_kwargs.update(registrar_tmpl_kwargs)
-            registrar_tmpl_str = registrar.plugin_object.template(
+            tmpl_str = registrar.plugin_object.template(
                 host,
                 registrar_settings,
                 req.params)
             tmpl = "registration.html"
-            loader[tmpl] = registrar_tmpl_str
+            tmpl_plugin = registrar.name
 
     elif auth_type is not None:
-        auth_plugin, auth_tmpl_settings = get_plugin(auth_type, "authenticator", settings, plugins, nolookup=True)
+        auth_plugin, auth_tmpl_settings = resolver.get_plugin(auth_type, "authenticator", settings, nolookup=True)
         if auth_plugin is not None:
-            auth_tmpl_kwargs = auth_plugin.plugin_object.handle(
-                host,
-                auth_tmpl_settings,
-                req.params,
-                ds,
-                finder)
+            try:
+                auth_tmpl_kwargs = auth_plugin.plugin_object.handle(
+                    host,
+                    auth_tmpl_settings,
+                    req.params,
+                    ds,
+                    finder)
+            except ExecutorBusy:
+                logger.warning("{} is too busy".format(auth_plugin.name), exc_info=True)
+                auth_tmpl_kwargs = auth_plugin.plugin_object.busy(
+                    host,
+                    auth_tmpl_settings,
+                    req.params,
+                    BUSY_MESSAGE)
+                status = 503
             if auth_tmpl_kwargs is not None:
                 subject = auth_tmpl_kwargs.get("subject", None)
                 authenticated = auth_tmpl_kwargs.get("authenticated", False)
@@ -186,17 +354,33 @@ def authenticate(req):
                         logger.warning('Error setting factored_complainant', exc_info=True)
                     return resp
                 tmpl_kwargs.update(auth_tmpl_kwargs)
-            auth_tmpl_str = auth_plugin.plugin_object.template(host, auth_tmpl_settings, req.params)
+            if "delivery_id" in tmpl_kwargs:
+                tmpl_kwargs["delivery_url"] = "?" + urlencode([
+                    ("src", "/"),
+                    (DELIVERY_PARAM, tmpl_kwargs["delivery_id"]),
+                ])
+            tmpl_str = auth_plugin.plugin_object.template(host, auth_tmpl_settings, req.params)
             tmpl = "authtype.html"
-            loader[tmpl] = auth_tmpl_str
+            tmpl_plugin = auth_plugin.name
 
     # render out the result of the base template + auth template
-    tmpl_env = jinja2.Environment(
-        loader=jinja2.DictLoader(loader),
-        autoescape=jinja2.select_autoescape(['html', 'xml']))
-    tmpl_rendered = tmpl_env.get_template(tmpl).render(**tmpl_kwargs)
-
-    return Response(body=tmpl_rendered, status=200)
+    compiled = get_template_cache(reqsettings).get_template(
+        base_tmpl_plugin.name, base_tmpl_str, tmpl, tmpl_plugin, tmpl_str)
+    if status == 200 and STATELESS_PARAMS.issuperset(req.params.keys()):
+        # the compiled template is the same object for the same sources, so
+        # it identifies the templates in the key
+        pages = get_page_cache(reqsettings)
+        key = pages.key(host, compiled, tmpl_kwargs)
+        if key is not None:
+            page = pages.get_page(key, compiled, tmpl_kwargs)
+            if page is not None:
+                return page.response(req, tmpl_kwargs["src"])
+    tmpl_rendered = compiled.render(**tmpl_kwargs)
+
+    resp = Response(body=tmpl_rendered, status=status)
+    if status == 503:
+        resp.retry_after = 5
+    return resp
 
 
 @view_config(route_name='status')
@@ -210,27 +394,29 @@ def status(req):
         return Response(status=500)
 
     # check that we can get all the appropriate settings
-    sp, _ = get_plugin("plugins.settings", "settings", reqsettings, plugin_manager)
-    settings = {}
-    settings.update(req.registry.settings)
+    resolver = get_resolver(reqsettings)
+    sp, _ = resolver.get_plugin("plugins.settings", "settings", reqsettings)
     if sp is None:
         logger.error("no settings plugin found")
         return Response(status=500)
     else:
         try:
-            settings.update(sp.plugin_object.get_request_settings(host))
+            # bypass the cache, the status should reflect the settings plugin
+            request_settings = sp.plugin_object.get_request_settings(host)
         except Exception:
             logger.error("couldn't fetch settings through settings plugin", exc_info=True)
             return Response(status=500)
+        settings = resolver.settings.layer(request_settings)
+        resolver.track(host, settings)
 
     # check we can get the datastore
-    ds, _ = get_plugin("plugins.datastore", "datastore", settings, plugin_manager)
+    ds, _ = resolver.get_plugin("plugins.datastore", "datastore", settings)
     if ds is None:
         logger.error("no data store plugin found")
         return Response(status=500)
 
     # check we can get the finder
-    finder, _ = get_plugin("plugins.finder", "finder", settings, plugin_manager)
+    finder, _ = resolver.get_plugin("plugins.finder", "finder", settings)
     if finder is None:
         logger.error("no finder plugin found")
         return Response(status=500)
@@ -243,7 +429,7 @@ def status(req):
             return Response(status=500)
 
     # check we can get the template
-    template, _ = get_plugin("plugins.template", "template", settings, plugin_manager)
+    template, _ = resolver.get_plugin("plugins.template", "template", settings)
     if template is None:
         logger.error("no template plugin found")
         return Response(status_code=500)
@@ -265,6 +451,16 @@ def app(global_config, **settings):
     # setup the wsgi app
     config = Configurator(settings=settings)
     config.include('pyramid_mailer')
+    config.registry.settings["plugins.resolver"] = PluginResolver(
+        plugins, config.registry.settings)
+    get_static_assets(config.registry.settings)
+    get_page_cache(config.registry.settings)
+    sweeper = get_sweeper(config.registry.settings)
+    if sweeper is not None:
+        sweeper.start()
+    templates = get_template_cache(config.registry.settings)
+    if settings.get("authenticator.templates.precompile", "false").strip().lower() == "true":
+        templates.precompile(plugins)
     config.add_route('authenticate', '/')
     config.add_route('status', '/authenticator-status')
     config.scan('factored.authenticator')
@@ -0,0 +1,203 @@
+import hashlib
+import threading
+from urllib.parse import urlencode
+import zlib
+
+from pyramid.response import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import logging
+logger = logging.getLogger('factored.authenticator')
+
+
+# static assets are requested from the authenticator with this param, rather
+# than with their own route, since nginx only forwards to the authenticator's
+# root (see lua/nginx_access.lua)
+ASSET_PARAM = "factored_asset"
+
+# asset urls contain a hash of the content, so they can be cached "forever"
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def accepted_encodings(header):
+    """
+    Arguments:
+    header -- value of an Accept-Encoding header
+
+    Returns:
+    set of the (lower case) content codings the header accepts
+    """
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            accepted.add(name)
+    return accepted
+
+
+def etag_matches(req, etag):
+    """
+    Arguments:
+    req -- the request
+    etag -- the (unquoted) ETag of the current response
+
+    Returns:
+    True if the request's If-None-Match header has etag, IE the client already
+    has the response and a 304 can be sent instead
+    """
+    for tag in req.headers.get("If-None-Match", "").split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag.strip('"') == etag:
+            return True
+    return False
+
+
+class StaticAsset(object):
+    """
+    StaticAsset is a static file provided by an ITemplatePlugin, with its
+    gzip (and, if the brotli package is installed, brotli) compressed
+    variants built up front and an ETag per variant.
+    """
+    def __init__(self, name, content_type, content):
+        """
+        Arguments:
+        name -- name of the asset, IE "default.css"
+        content_type -- mime type of the asset
+        content -- str (encoded as utf-8) or bytes
+        """
+        self.name = name
+        self.content_type = content_type
+        self.charset = None
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+            self.charset = "utf-8"
+        self.digest = hashlib.sha256(content).hexdigest()[:32]
+        self.url = "?" + urlencode([
+            # a src param keeps nginx_access.lua from redirecting
+            ("src", "/"),
+            (ASSET_PARAM, name),
+            ("v", self.digest[:12]),
+        ])
+
+        gz = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self.variants = {
+            "identity": content,
+            "gzip": gz.compress(content) + gz.flush(),
+        }
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(content)
+
+    def etag(self, encoding):
+        if encoding == "identity":
+            return self.digest
+        return "{}-{}".format(self.digest, encoding)
+
+    def response(self, req):
+        """
+        Arguments:
+        req -- the request for the asset
+
+        Returns:
+        a Response with the best variant the request accepts, or a 304 if the
+        request already has it
+        """
+        accepted = accepted_encodings(req.headers.get("Accept-Encoding", ""))
+        encoding = "identity"
+        for candidate in ("br", "gzip"):
+            if candidate in accepted and candidate in self.variants:
+                encoding = candidate
+                break
+        etag = self.etag(encoding)
+
+        headers = {
+            "Cache-Control": CACHE_CONTROL,
+            "ETag": '"{}"'.format(etag),
+            "Vary": "Accept-Encoding",
+        }
+        if etag_matches(req, etag):
+            return Response(status=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        resp = Response(
+            body=self.variants[encoding],
+            status=200,
+            content_type=self.content_type,
+            charset=self.charset)
+        resp.headers.update(headers)
+        return resp
+
+
+class StaticAssets(object):
+    """
+    StaticAssets holds the StaticAsset's of every ITemplatePlugin used by the
+    app, built the first time the template plugin is used.
+    """
+    def __init__(self):
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def get(self, template):
+        """
+        Arguments:
+        template -- PluginInfo of the ITemplatePlugin
+
+        Returns:
+        dict of asset name to StaticAsset
+        """
+        assets = self._assets.get(template.name, None)
+        if assets is None:
+            assets = {}
+            try:
+                provided = template.plugin_object.static_assets()
+            except Exception:
+                logger.error("couldn't get static assets of {}".format(template.name),
+                             exc_info=True)
+                provided = {}
+            for name, (content_type, content) in provided.items():
+                assets[name] = StaticAsset(name, content_type, content)
+            with self._lock:
+                assets = self._assets.setdefault(template.name, assets)
+        return assets
+
+    def urls(self, template):
+        """
+        Arguments:
+        template -- PluginInfo of the ITemplatePlugin
+
+        Returns:
+        dict of asset name to the url it's served at
+        """
+        return {name: asset.url for name, asset in self.get(template).items()}
+
+
+def get_static_assets(settings):
+    """
+    Arguments:
+    settings -- the app settings
+
+    Returns:
+    the StaticAssets of the app, created and stored as
+    "authenticator.static_assets" in settings if the app didn't already set
+    one up
+    """
+    assets = settings.get("authenticator.static_assets", None)
+    if assets is None:
+        assets = StaticAssets()
+        settings["authenticator.static_assets"] = assets
+    return assets
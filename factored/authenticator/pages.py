@@ -0,0 +1,175 @@
+import hashlib
+import uuid
+
+from markupsafe import escape
+from pyramid.response import Response
+
+from factored.authenticator.assets import etag_matches
+from factored.cache import TTLCache
+
+import logging
+logger = logging.getLogger('factored.authenticator')
+
+
+# the rendered pages are revalidated on every use, since they're only cached
+# for as long as the page cache keeps them
+CACHE_CONTROL = "private, no-cache"
+
+# rendered in place of src to check a page can be split on it
+PROBE_SRC = "/a b?c=\"d\"&e=<f>'g'%20#h"
+
+
+def freeze(value):
+    """
+    Arguments:
+    value -- template kwargs, IE nested dicts, lists and scalars
+
+    Returns:
+    a hashable equivalent of value
+
+    Raises:
+    TypeError if value has anything that isn't hashable
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    hash(value)
+    return value
+
+
+class RenderedPage(object):
+    """
+    RenderedPage is a rendered page with the src param cut out of it, so the
+    same page can be sent for any src by joining the parts with the escaped
+    src.
+    """
+    __slots__ = ("parts", "digest")
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.digest = hashlib.sha256(
+            "\0".join(parts).encode("utf-8")).hexdigest()
+
+    def body(self, src):
+        return str(escape(src)).join(self.parts)
+
+    def etag(self, src):
+        return hashlib.sha256(
+            "{}\0{}".format(self.digest, src).encode("utf-8")).hexdigest()[:32]
+
+    def response(self, req, src):
+        """
+        Arguments:
+        req -- the request for the page
+        src -- the src param of the request
+
+        Returns:
+        a Response with the page for src, or a 304 if the request already
+        has it
+        """
+        etag = self.etag(src)
+        headers = {
+            "Cache-Control": CACHE_CONTROL,
+            "ETag": '"{}"'.format(etag),
+        }
+        if etag_matches(req, etag):
+            return Response(status=304, headers=headers)
+        resp = Response(body=self.body(src), status=200)
+        resp.headers.update(headers)
+        return resp
+
+
+class PageCache(object):
+    """
+    PageCache holds rendered authenticator pages that only depend on the
+    template kwargs, keyed by host, the templates and the kwargs other than
+    src. Pages are rendered with a placeholder for src, which is swapped for
+    the request's src when a page is sent.
+
+    Templates that use src with a filter (IE "{{ src|urlencode }}") can't
+    be split this way; this is detected when the page is first rendered, by
+    also rendering it with a src full of special characters, and those pages
+    are rendered per request.
+    """
+    def __init__(self, max_size=1000, ttl=300):
+        self.pages = TTLCache(max_size=max_size, ttl=ttl)
+        self.placeholder = "factoredsrc{}".format(uuid.uuid4().hex)
+
+    def key(self, host, template_key, tmpl_kwargs):
+        """
+        Arguments:
+        host -- host the page is for
+        template_key -- hashable identifying the templates, IE the plugin
+                        names and template source hashes
+        tmpl_kwargs -- the kwargs the page is rendered with
+
+        Returns:
+        the cache key of the page, or None if the kwargs can't be hashed
+        """
+        kwargs = dict(tmpl_kwargs)
+        kwargs.pop("src", None)
+        try:
+            return (host, template_key, freeze(kwargs))
+        except TypeError:
+            return None
+
+    def get_page(self, key, compiled, tmpl_kwargs):
+        """
+        Arguments:
+        key -- cache key of the page from PageCache.key
+        compiled -- the compiled jinja2.Template of the page
+        tmpl_kwargs -- the kwargs the page is rendered with
+
+        Returns:
+        the RenderedPage for key, rendered if it wasn't already cached, or
+        None if the page can't be cached, in which case the caller renders
+        the page itself
+        """
+        if self.pages.ttl <= 0:
+            return None
+        page = self.pages.get(key, None)
+        if page is not None:
+            return page or None
+
+        src = tmpl_kwargs.get("src", "")
+        kwargs = dict(tmpl_kwargs)
+        kwargs["src"] = self.placeholder
+        page = RenderedPage(tuple(compiled.render(**kwargs).split(self.placeholder)))
+        # a filter can leave a simple src (IE "/") as is, so the split is also
+        # checked with a src full of the characters filters change
+        kwargs["src"] = PROBE_SRC
+        if page.body(src) != compiled.render(**tmpl_kwargs) or \
+                page.body(PROBE_SRC) != compiled.render(**kwargs):
+            logger.debug("page uses src in a way that can't be cached")
+            # remember it, so the page isn't rendered twice every time
+            self.pages.set(key, False)
+            return None
+        self.pages.set(key, page)
+        return page
+
+
+def get_page_cache(settings):
+    """
+    Arguments:
+    settings -- the app settings
+
+    Returns:
+    the PageCache of the app, created and stored as
+    "authenticator.page_cache" in settings if the app didn't already set one
+    up. Pages are kept for "authenticator.page_cache.ttl" seconds (default
+    300, 0 disables the cache), and at most
+    "authenticator.page_cache.max_size" (default 1000) pages are kept.
+    """
+    cache = settings.get("authenticator.page_cache", None)
+    if cache is None:
+        try:
+            ttl = int(settings.get("authenticator.page_cache.ttl", 300))
+            max_size = int(settings.get("authenticator.page_cache.max_size", 1000))
+        except Exception:
+            logger.error("failed to get authenticator.page_cache config", exc_info=True)
+            ttl = 300
+            max_size = 1000
+        cache = PageCache(max_size=max_size, ttl=ttl)
+        settings["authenticator.page_cache"] = cache
+    return cache
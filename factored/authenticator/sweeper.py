@@ -0,0 +1,102 @@
+import threading
+import time
+
+import logging
+logger = logging.getLogger('factored.authenticator')
+
+
+class ExpirySweeper(object):
+    """
+    ExpirySweeper periodically purges access requests that are too old to be
+    used from the datastore plugins the app has resolved, for the app
+    settings and for each host, from a background thread, so stale requests
+    don't pile up in the datastores. The datastores have to be initialized.
+    """
+    def __init__(self, resolver, interval=60, max_age=3600, clock=time.time):
+        """
+        Arguments:
+        resolver -- the PluginResolver of the app
+
+        Keyword Arguments:
+        interval -- seconds between sweeps
+        max_age -- seconds after which an access request is purged
+        clock -- function returning the current timestamp
+        """
+        self.resolver = resolver
+        self.interval = interval
+        self.max_age = max_age
+        self.clock = clock
+        self.purged = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def sweep(self):
+        """
+        purges the expired access requests once
+
+        Returns:
+        the number of access requests purged
+        """
+        # make sure the app's datastore is resolved, even before any request
+        self.resolver.get_plugin("plugins.datastore", "datastore", self.resolver.settings)
+        before = self.clock() - self.max_age
+        purged = 0
+        for ds in self.resolver.resolved_plugins("datastore"):
+            try:
+                purged += ds.plugin_object.purge_expired(before)
+            except Exception:
+                logger.error("failed to purge expired access requests from {}".format(ds.name),
+                             exc_info=True)
+        self.purged += purged
+        if purged:
+            logger.info("purged {} expired access requests".format(purged))
+        return purged
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.error("failed to purge expired access requests", exc_info=True)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="factored-expiry-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def get_sweeper(settings):
+    """
+    Arguments:
+    settings -- the app settings, with "plugins.resolver" set up
+
+    Returns:
+    the ExpirySweeper of the app, created and stored as
+    "authenticator.sweeper" in settings if the app didn't already set one up.
+    Sweeps run every "authenticator.purge.interval" seconds (default 0, which
+    disables the sweeper, in which case None is returned) and purge access
+    requests older than "authenticator.purge.max_age" seconds (default 3600).
+    The sweeper is opt in since the app doesn't initialize datastore plugins
+    itself, so it's only useful with datastores initialized some other way.
+    """
+    sweeper = settings.get("authenticator.sweeper", None)
+    if sweeper is None:
+        try:
+            interval = float(settings.get("authenticator.purge.interval", 0))
+            max_age = float(settings.get("authenticator.purge.max_age", 3600))
+        except Exception:
+            logger.error("failed to get authenticator.purge config", exc_info=True)
+            interval = 0
+            max_age = 3600
+        if interval <= 0:
+            return None
+        sweeper = ExpirySweeper(settings["plugins.resolver"], interval=interval, max_age=max_age)
+        settings["authenticator.sweeper"] = sweeper
+    return sweeper
@@ -1,3 +1,4 @@
+import time
 import unittest
 
 import jwt
@@ -41,6 +42,70 @@ class JWTTests(unittest.TestCase):
         self.assertEqual(chttponly, False)
 
 
+class TemplateCacheTests(unittest.TestCase):
+    def test_get_template(self):
+        from factored.authenticator import TemplateCache
+
+        cache = TemplateCache()
+        child = '{% extends "base.html" %}{% block content %}<b>{{ name }}</b>{% endblock %}'
+        base1 = '1:{% block content %}{% endblock %}'
+        base2 = '2:{% block content %}{% endblock %}'
+
+        tmpl = cache.get_template("Base", base1, "authtype.html", "Auth", child)
+        self.assertIs(tmpl, cache.get_template("Base", base1, "authtype.html", "Auth", child))
+        self.assertEqual(tmpl.render(name="<x>"), "1:<b>&lt;x&gt;</b>")
+
+        # the same child template extends whichever base it was given
+        tmpl = cache.get_template("Base", base2, "authtype.html", "Auth", child)
+        self.assertEqual(tmpl.render(name="y"), "2:<b>y</b>")
+        self.assertEqual(cache.get_template("Base", base1).render(), "1:")
+
+    def test_max_size(self):
+        from factored.authenticator import TemplateCache
+
+        cache = TemplateCache(max_size=2)
+        for i in range(5):
+            self.assertEqual(cache.get_template("Base", str(i)).render(), str(i))
+        self.assertLessEqual(len(cache._templates), 2)
+
+    def test_evicted_template_renders(self):
+        from factored.authenticator import TemplateCache
+
+        cache = TemplateCache(max_size=2)
+        child = '{% extends "base.html" %}{% block content %}{{ name }}{% endblock %}'
+        tmpl = cache.get_template("Base", "a:{% block content %}{% endblock %}", "authtype.html", "Auth", child)
+        cache.get_template("Base", "b")
+        cache.get_template("Base", "a:{% block content %}{% endblock %}", "authtype.html", "Auth", child)
+        cache.get_template("Base", "c")
+        # the least recently used template was dropped, not the child
+        self.assertEqual(len(cache._templates), 2)
+        self.assertIs(tmpl, cache.get_template(
+            "Base", "a:{% block content %}{% endblock %}", "authtype.html", "Auth", child))
+        for i in range(5):
+            cache.get_template("Base", str(i))
+        # a template dropped from the cache (IE while being rendered) still
+        # extends its own base
+        self.assertEqual(tmpl.render(name="x"), "a:x")
+
+
+class PageCacheTests(unittest.TestCase):
+    def test_filtered_src(self):
+        import jinja2
+        from factored.authenticator.pages import PageCache
+
+        env = jinja2.Environment(autoescape=True)
+        pages = PageCache()
+        plain = env.from_string('<input value="{{ src }}">')
+        page = pages.get_page(pages.key("host", "plain", {}), plain, {"src": "/"})
+        self.assertEqual(page.body('/"x"'), '<input value="/&#34;x&#34;">')
+
+        # "/" is the same urlencoded or not, the probe render catches it
+        encoded = env.from_string('<a href="/?src={{ src|urlencode }}">')
+        key = pages.key("host", "encoded", {})
+        self.assertIsNone(pages.get_page(key, encoded, {"src": "/"}))
+        self.assertIs(pages.pages.get(key), False)
+
+
 class AuthenticateViewTests(unittest.TestCase):
     def setUp(self):
         settings = {
@@ -158,6 +223,13 @@ class AuthenticateViewTests(unittest.TestCase):
         self.assertEquals(resp.status_code, 200)
         self.assertIn('<input type="hidden" name="email" value="test@wildcardcorp.com" />', resp.text)
 
+    def test_busy_kwargs(self):
+        from factored.plugins import IAuthenticatorPlugin
+
+        # other authenticators don't get EMailAuth's form fields
+        params = {"email": "test@wildcardcorp.com", "code": "1234"}
+        self.assertEqual(IAuthenticatorPlugin().busy("host", {}, params, "busy"), {"err": "busy"})
+
     def test_auth_codesubmitted(self):
         from factored.authenticator import authenticate
 
@@ -173,3 +245,118 @@ class AuthenticateViewTests(unittest.TestCase):
         self.assertIn('class="error-box"', resp.text)
 
         # TODO test valid submission
+
+    def test_static_asset(self):
+        import gzip
+        from factored.authenticator import authenticate
+        from factored.plugins.defaults.templates.DefaultTemplate import STYLESHEET
+
+        req = testing.DummyRequest()
+        resp = authenticate(req)
+        self.assertIn('factored_asset=default.css', resp.text)
+        self.assertNotIn('.pure-button', resp.text)
+
+        req = testing.DummyRequest(
+            params={'factored_asset': 'default.css'},
+            headers={'Accept-Encoding': 'gzip, deflate'})
+        resp = authenticate(req)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'text/css')
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', resp.headers['Cache-Control'])
+        self.assertEqual(gzip.decompress(resp.body).decode('utf-8'), STYLESHEET)
+
+        req = testing.DummyRequest(
+            params={'factored_asset': 'default.css'},
+            headers={'If-None-Match': resp.headers['ETag']})
+        self.assertEqual(authenticate(req).status_code, 200)
+        req.headers['Accept-Encoding'] = 'gzip'
+        self.assertEqual(authenticate(req).status_code, 304)
+
+        req = testing.DummyRequest(params={'factored_asset': 'missing.css'})
+        self.assertEqual(authenticate(req).status_code, 404)
+
+    def test_page_cache(self):
+        from factored.authenticator import authenticate
+
+        req = testing.DummyRequest(params={'src': '/a?b=1&c=2'})
+        first = authenticate(req)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('value="/a?b=1&amp;c=2"', first.text)
+        pages = self.config.registry.settings["authenticator.page_cache"]
+        self.assertEqual(len(pages.pages), 1)
+
+        # a different src reuses the cached page
+        resp = authenticate(testing.DummyRequest(params={'src': '/"x"'}))
+        self.assertIn('value="/&#34;x&#34;"', resp.text)
+        self.assertNotEqual(resp.headers['ETag'], first.headers['ETag'])
+        self.assertEqual(len(pages.pages), 1)
+        self.assertEqual(pages.pages.hits, 1)
+
+        req = testing.DummyRequest(
+            params={'src': '/a?b=1&c=2'},
+            headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(authenticate(req).status_code, 304)
+
+        # pages with user input aren't cached
+        authenticate(testing.DummyRequest(params={
+            'authtype': 'EMailAuth',
+            'email': 'test@wildcardcorp.com',
+        }))
+        self.assertEqual(len(pages.pages), 1)
+
+    def test_sweeper(self):
+        from factored.authenticator.sweeper import ExpirySweeper, get_sweeper
+        from factored.plugins import get_resolver
+
+        settings = self.config.registry.settings
+        ds = settings["datastore"].plugin_object
+        now = time.time()
+        ds.store_access_request("localhost", "old@wildcardcorp.com", now - 120, "code")
+        ds.store_access_request("localhost", "new@wildcardcorp.com", now - 10, "code")
+        sweeper = ExpirySweeper(get_resolver(settings), max_age=60, clock=lambda: now)
+        self.assertEqual(sweeper.sweep(), 1)
+        self.assertIsNone(ds.get_access_request("localhost", "old@wildcardcorp.com"))
+        self.assertIsNotNone(ds.get_access_request("localhost", "new@wildcardcorp.com"))
+
+        # datastores that fail, IE aren't initialized, don't stop the others
+        broken = get_manager().getPluginByName("SQLDataStore", category="datastore")
+        resolver = get_resolver(settings)
+        resolver.resolved_plugins = lambda category: [broken, settings["datastore"]]
+        ds.store_access_request("localhost", "old@wildcardcorp.com", now - 120, "code")
+        self.assertEqual(sweeper.sweep(), 1)
+
+        self.assertIsNone(get_sweeper(settings))
+        settings["authenticator.purge.interval"] = "60"
+        self.assertEqual(get_sweeper(settings).interval, 60)
+
+    def test_delivery_status(self):
+        from factored.authenticator import authenticate
+
+        req = testing.DummyRequest(params={'factored_delivery': 'notarealid'})
+        resp = authenticate(req)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json_body, {'status': 'unknown'})
+
+    def test_auth_busy(self):
+        from factored.authenticator import authenticate
+        from factored.plugins import get_executor
+
+        # hashing the code is refused while the executor is saturated
+        settings = {"executor.max_pending": "1"}
+        self.config.registry.settings["plugin.EMailAuth.executor.max_pending"] = "1"
+        executor = get_executor(settings)
+        executor._slots.acquire()
+        try:
+            req = testing.DummyRequest(params={
+                'authtype': 'EMailAuth',
+                'submit': 'email',
+                'email': 'test@wildcardcorp.com',
+            })
+            resp = authenticate(req)
+        finally:
+            executor._slots.release()
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp.headers['Retry-After'], '5')
+        self.assertIn('try again in a moment', resp.text)
+        self.assertIn('<input type="hidden" name="email" value="test@wildcardcorp.com" />', resp.text)
@@ -0,0 +1,101 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache(object):
+    """
+    TTLCache is a thread-safe cache with a maximum number of entries, least
+    recently used eviction once it's full, and a time to live for each entry.
+    A ttl of 0 or less disables the cache, IE nothing is ever stored.
+    """
+    def __init__(self, max_size=1000, ttl=60, clock=time.monotonic):
+        """
+        Keyword Arguments:
+        max_size -- maximum number of entries kept
+        ttl -- default number of seconds an entry lives for
+        clock -- function returning the current time in seconds
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key, default=None, count=True):
+        """
+        Arguments:
+        key -- key of the entry
+
+        Keyword Arguments:
+        default -- returned if there is no live entry for key
+        count -- False to leave the hit/miss stats alone
+
+        Returns:
+        the cached value for key, or default
+        """
+        with self._lock:
+            entry = self._data.get(key, None)
+            if entry is not None:
+                if entry[0] > self.clock():
+                    self._data.move_to_end(key)
+                    if count:
+                        self.hits += 1
+                    return entry[1]
+                del self._data[key]
+            if count:
+                self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """
+        Arguments:
+        key -- key of the entry
+        value -- value to cache
+
+        Keyword Arguments:
+        ttl -- seconds the entry lives for, if not the default for the cache
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (self.clock() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        """
+        Keyword Arguments:
+        key -- the entry to drop, or None to drop every entry
+        """
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        """
+        Returns:
+        a dict of the hits, misses, evictions and current size of the cache
+        """
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            size=len(self._data))
+
+
+_MISSING = object()
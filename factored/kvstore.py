@@ -0,0 +1,240 @@
+"""
+A small key/value daemon holding access requests in memory, shared by every
+authenticator process on a host through a Unix socket, see the
+SocketDataStore plugin.
+
+usage: factored_kvstore --socket /run/factored/kvstore.sock [--ttl 300]
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+
+from factored.plugins.defaults.datastores.MemDataStore import MemDataStore
+
+import logging
+logger = logging.getLogger('factored.kvstore')
+
+
+# requests and responses are JSON arrays, one per line. Requests are
+# [command, args...], responses are ["ok", result] or ["error", message]
+COMMANDS = {
+    "set": "store_access_request",
+    "get": "get_access_request",
+    "delete": "delete_access_requests",
+    "purge": "purge_expired",
+    "stats": "stats",
+}
+
+
+class KVStoreError(Exception):
+    pass
+
+
+class KVStoreHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode("utf-8"))
+                method = getattr(self.server.store, COMMANDS[request[0]])
+                response = ["ok", method(*request[1:])]
+            except Exception as ex:
+                logger.error("kvstore request failed", exc_info=True)
+                response = ["error", "{}: {}".format(type(ex).__name__, ex)]
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+def socket_in_use(path):
+    """
+    Arguments:
+    path -- path of a Unix socket
+
+    Returns:
+    True if something is listening on the socket
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+class KVStoreServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    KVStoreServer serves a MemDataStore on a Unix socket, with a thread per
+    connection. The socket is bound with a umask that leaves it usable only
+    by the user running the authenticator, then given the file mode
+    (default 0o600). A socket
+    left behind by a daemon that's gone is replaced, but one another daemon
+    is listening on is not.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, settings=None, mode=0o600):
+        """
+        Arguments:
+        path -- path of the Unix socket
+
+        Keyword Arguments:
+        settings -- MemDataStore settings, IE "max_entries" and "ttl"
+        mode -- file mode of the socket
+
+        Raises:
+        KVStoreError if another daemon is listening on path
+        """
+        if os.path.exists(path):
+            if socket_in_use(path):
+                raise KVStoreError("{} is in use by another kvstore".format(path))
+            os.unlink(path)
+        self.mode = mode
+        self.store = MemDataStore()
+        self.store.initialize(settings or {})
+        socketserver.UnixStreamServer.__init__(self, path, KVStoreHandler)
+
+    def server_bind(self):
+        # the socket is created with the umask, so it's never usable by
+        # other users between being bound and being given its mode
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+        os.chmod(self.server_address, self.mode)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class KVStoreClient(object):
+    """
+    KVStoreClient talks to a KVStoreServer, keeping up to pool_size
+    connections open for reuse between calls. A command that couldn't be
+    sent on a reused connection the server has since closed is sent again
+    on a new connection.
+    """
+    def __init__(self, path, pool_size=4, timeout=5):
+        """
+        Arguments:
+        path -- path of the server's Unix socket
+
+        Keyword Arguments:
+        pool_size -- maximum number of idle connections kept open
+        timeout -- seconds to wait on the server
+        """
+        self.path = path
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except Exception:
+            sock.close()
+            raise
+        return (sock, sock.makefile("rb"))
+
+    def _receive(self, conn):
+        response = conn[1].readline()
+        if not response:
+            raise ConnectionError("kvstore closed the connection")
+        return json.loads(response.decode("utf-8"))
+
+    def call(self, command, *args):
+        """
+        Arguments:
+        command -- name of the command, see COMMANDS
+        args -- arguments of the command
+
+        Returns:
+        the result of the command
+
+        Raises:
+        KVStoreError if the server failed to run the command
+        """
+        line = json.dumps([command] + list(args)).encode("utf-8") + b"\n"
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        try:
+            if conn is None:
+                conn = self.connect()
+                conn[0].sendall(line)
+            else:
+                try:
+                    conn[0].sendall(line)
+                except ConnectionError:
+                    # sending on a Unix socket the server closed fails right
+                    # away, so the command didn't run and is sent again. Once
+                    # it's sent nothing is retried, since it might have run.
+                    self.discard(conn)
+                    conn = self.connect()
+                    conn[0].sendall(line)
+            status, result = self._receive(conn)
+        except Exception:
+            if conn is not None:
+                self.discard(conn)
+            raise
+        self.release(conn)
+        if status != "ok":
+            raise KVStoreError(result)
+        return result
+
+    def release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        self.discard(conn)
+
+    def discard(self, conn):
+        for f in reversed(conn):
+            try:
+                f.close()
+            except Exception:
+                pass
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self.discard(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--socket", required=True, help="path of the Unix socket")
+    parser.add_argument("--max-entries", default="100000")
+    parser.add_argument("--ttl", default="300",
+                        help="seconds access requests are kept, at least the longest code_timeout")
+    parser.add_argument("--mode", default="600", help="octal file mode of the socket")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        server = KVStoreServer(
+            args.socket,
+            settings={"max_entries": args.max_entries, "ttl": args.ttl},
+            mode=int(args.mode, 8))
+    except KVStoreError as ex:
+        parser.exit(1, "{}\n".format(ex))
+    logger.info("serving access requests on {}".format(args.socket))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
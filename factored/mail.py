@@ -1,6 +1,22 @@
+import atexit
 import binascii
+import collections
+import heapq
+import itertools
 import os
+import smtplib
+import threading
 import time
+import uuid
+
+from pyramid.settings import asbool, aslist
+from pyramid_mailer.mailer import Mailer
+from repoze.sendmail.encoding import encode_message
+
+from factored.cache import TTLCache
+
+import logging
+logger = logging.getLogger('factored.mail')
 
 
 def create_message_id(domain='localhost', mid=None):
@@ -11,3 +27,626 @@ def create_message_id(domain='localhost', mid=None):
     return "<{mid}@{domain}>".format(mid=mid, domain=domain)
 
 
+# delivery statuses, see DeliveryQueue
+QUEUED = "queued"
+RETRYING = "retrying"
+SENT = "sent"
+FAILED = "failed"
+
+
+class DeliveryQueueFull(Exception):
+    pass
+
+
+def _int_setting(settings, name, default):
+    try:
+        return int(settings.get(name, default))
+    except Exception:
+        logger.error("failed to get {} config".format(name), exc_info=True)
+        return default
+
+
+def _float_setting(settings, name, default):
+    try:
+        return float(settings.get(name, default))
+    except Exception:
+        logger.error("failed to get {} config".format(name), exc_info=True)
+        return default
+
+
+class SMTPConnectionPool(object):
+    """
+    SMTPConnectionPool keeps up to size open connections to an SMTP server,
+    so that sending a message doesn't mean connecting, EHLO, STARTTLS and
+    logging in every time. Connections idle for longer than idle_timeout
+    seconds are closed rather than reused, since servers drop them.
+    """
+    def __init__(self, smtp_mailer, size=2, idle_timeout=60, clock=time.monotonic):
+        """
+        Arguments:
+        smtp_mailer -- the repoze.sendmail SMTPMailer with the server
+                       details, IE Mailer.smtp_mailer
+
+        Keyword Arguments:
+        size -- maximum number of idle connections kept open
+        idle_timeout -- seconds a connection can be idle and still be reused
+        clock -- function returning the current time in seconds
+        """
+        self.smtp_mailer = smtp_mailer
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.connects = 0
+        self.reuses = 0
+        self.reconnects = 0
+        self.expired = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """
+        Returns:
+        dict of the number of connections opened, sends that reused an open
+        connection, reused connections the server had dropped and that were
+        replaced, and idle connections closed for being idle too long
+        """
+        return {
+            "connects": self.connects,
+            "reuses": self.reuses,
+            "reconnects": self.reconnects,
+            "expired": self.expired,
+            "idle": len(self._idle),
+        }
+
+    def connect(self):
+        """
+        Returns:
+        a new connection, ready to send messages with, set up the same way
+        repoze.sendmail's SMTPMailer.send does
+        """
+        mailer = self.smtp_mailer
+        connection = mailer.smtp_factory()
+        with self._lock:
+            self.connects += 1
+        try:
+            code, response = connection.ehlo()
+            if code < 200 or code >= 300:
+                code, response = connection.helo()
+                if code < 200 or code >= 300:
+                    raise smtplib.SMTPHeloError(code, response)
+
+            have_tls = connection.has_extn("starttls")
+            if not have_tls and mailer.force_tls:
+                raise smtplib.SMTPNotSupportedError("TLS is required but not available")
+            if have_tls and not mailer.no_tls:
+                connection.starttls()
+                connection.ehlo()
+
+            if mailer.username is not None and mailer.password is not None:
+                connection.login(mailer.username, mailer.password)
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    def acquire(self):
+        """
+        Returns:
+        (connection, reused), an idle connection if there's one that hasn't
+        timed out, otherwise a new one
+        """
+        now = self.clock()
+        expired = []
+        connection = None
+        with self._lock:
+            while self._idle:
+                idle, last_used = self._idle.pop()
+                if now - last_used < self.idle_timeout:
+                    connection = idle
+                    self.reuses += 1
+                    break
+                expired.append(idle)
+                self.expired += 1
+        for idle in expired:
+            self.discard(idle)
+        if connection is not None:
+            return connection, True
+        return self.connect(), False
+
+    def release(self, connection):
+        """
+        Returns a connection to the pool, or closes it if the pool is full
+
+        Arguments:
+        connection -- connection from acquire
+        """
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((connection, self.clock()))
+                return
+        self.discard(connection)
+
+    def discard(self, connection):
+        try:
+            connection.quit()
+        except Exception:
+            connection.close()
+
+    def close(self):
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+        for connection, _ in idle:
+            self.discard(connection)
+
+    def send(self, fromaddr, toaddrs, message):
+        """
+        Sends a message over a pooled connection. If a reused connection was
+        dropped by the server, the message is sent over a new one.
+
+        Arguments:
+        fromaddr -- envelope sender
+        toaddrs -- envelope recipients
+        message -- email.message.Message to send
+        """
+        message = encode_message(message)
+        connection, reused = self.acquire()
+        try:
+            connection.sendmail(fromaddr, toaddrs, message)
+        except Exception as ex:
+            self.discard(connection)
+            dropped = isinstance(ex, (smtplib.SMTPServerDisconnected, ConnectionError))
+            if not (reused and dropped):
+                raise
+            with self._lock:
+                self.reconnects += 1
+            connection = self.connect()
+            try:
+                connection.sendmail(fromaddr, toaddrs, message)
+            except Exception:
+                self.discard(connection)
+                raise
+        self.release(connection)
+
+
+# the pyramid_mailer settings that pick the server and how to talk to it,
+# every setting Mailer.from_settings reads
+MAILER_SETTINGS = (
+    "host", "port", "username", "password", "tls", "ssl",
+    "keyfile", "certfile", "queue_path", "debug", "default_sender",
+    "sendmail_app", "sendmail_template")
+
+
+def normalize_mail_settings(settings, prefix="mail."):
+    """
+    Arguments:
+    settings -- settings with the mail settings, IE a plugin's settings
+
+    Keyword Arguments:
+    prefix -- prefix of the mail settings
+
+    Returns:
+    dict of the MAILER_SETTINGS that are set, without the prefix and
+    normalized so that equivalent settings are equal, IE " 25" and "25", or
+    "True" and "true"
+    """
+    normalized = {}
+    for name in MAILER_SETTINGS:
+        value = settings.get(prefix + name, None)
+        if value is None:
+            continue
+        value = str(value).strip()
+        if name in ("tls", "ssl"):
+            value = str(asbool(value)).lower()
+        elif name in ("port", "debug") and value:
+            value = str(int(value))
+        elif name == "sendmail_template":
+            value = " ".join(aslist(value))
+        normalized[name] = value
+    return normalized
+
+
+def mailer_key(settings, prefix="mail."):
+    """
+    Arguments:
+    settings -- settings with the mail settings, IE a plugin's settings
+
+    Keyword Arguments:
+    prefix -- prefix of the mail settings
+
+    Returns:
+    a hashable of the normalized mail settings and the pool settings, the
+    same for settings that send mail the same way
+    """
+    normalized = normalize_mail_settings(settings, prefix=prefix)
+    return (
+        frozenset(normalized.items()),
+        _int_setting(settings, prefix + "pool_size", 2),
+        _int_setting(settings, prefix + "pool_idle_timeout", 60))
+
+
+class PooledMailer(Mailer):
+    """
+    PooledMailer is a pyramid_mailer Mailer whose send_immediately sends over
+    an SMTPConnectionPool rather than a new connection per message.
+    """
+    def __init__(self, **kw):
+        super(PooledMailer, self).__init__(**kw)
+        self.pool = SMTPConnectionPool(self.smtp_mailer)
+
+    def send_immediately(self, message, fail_silently=False):
+        try:
+            message.sender = message.sender or self.default_sender
+            return self.pool.send(message.sender, message.send_to, message.to_message())
+        except smtplib.socket.error:
+            if not fail_silently:
+                raise
+
+
+class MailerRegistry(object):
+    """
+    MailerRegistry holds a PooledMailer for each set of (normalized) mail
+    settings, so everything sending through the same server shares its open
+    connections.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._mailers = {}
+        self._lock = threading.Lock()
+
+    def get_mailer(self, settings, prefix="mail."):
+        """
+        Arguments:
+        settings -- settings with the mail settings, IE a plugin's settings
+
+        Keyword Arguments:
+        prefix -- prefix of the mail settings
+
+        Returns:
+        the PooledMailer for the settings, keeping at most "mail.pool_size"
+        (default 2) idle connections open for "mail.pool_idle_timeout"
+        (default 60) seconds
+        """
+        key = mailer_key(settings, prefix=prefix)
+        normalized, pool_size, idle_timeout = key
+
+        mailer = self._mailers.get(key, None)
+        if mailer is not None:
+            self.hits += 1
+            return mailer
+        with self._lock:
+            mailer = self._mailers.get(key, None)
+            if mailer is None:
+                self.misses += 1
+                mailer = PooledMailer.from_settings(
+                    {prefix + k: v for k, v in normalized}, prefix=prefix)
+                mailer.pool.size = pool_size
+                mailer.pool.idle_timeout = idle_timeout
+                self._mailers[key] = mailer
+        return mailer
+
+    def stats(self):
+        """
+        Returns:
+        dict of the number of mailers, how many times an existing mailer was
+        reused or a new one created, and the totals of the pool stats of
+        every mailer
+        """
+        stats = {
+            "mailers": len(self._mailers),
+            "reused": self.hits,
+            "created": self.misses,
+        }
+        for mailer in list(self._mailers.values()):
+            for name, value in mailer.pool.stats().items():
+                stats[name] = stats.get(name, 0) + value
+        return stats
+
+    def close(self):
+        with self._lock:
+            mailers = list(self._mailers.values())
+            self._mailers.clear()
+        for mailer in mailers:
+            mailer.pool.close()
+
+
+def is_transient(ex):
+    """
+    Arguments:
+    ex -- exception raised sending a message
+
+    Returns:
+    True if sending again later might work, IE the connection failed or the
+    server answered with a 4xx code, False if it won't, IE the server
+    refused the message with a 5xx code or the message couldn't be built
+    """
+    if isinstance(ex, smtplib.SMTPRecipientsRefused):
+        return bool(ex.recipients) and all(
+            400 <= code < 500 for code, _ in ex.recipients.values())
+    if isinstance(ex, smtplib.SMTPConnectError):
+        return True
+    if isinstance(ex, smtplib.SMTPResponseException):
+        return 400 <= ex.smtp_code < 500
+    if isinstance(ex, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(ex, smtplib.SMTPException):
+        # SMTPException is an OSError, but the others mean the server and
+        # the mailer don't agree, IE on TLS, which won't change on a retry
+        return False
+    return isinstance(ex, OSError)
+
+
+class DeliveryQueue(object):
+    """
+    DeliveryQueue sends messages in the background with worker threads that
+    share an SMTPConnectionPool. Sends that fail for a transient reason (see
+    is_transient) are retried up to retries times, waiting retry_delay
+    seconds before the first retry and twice as long before each one after
+    that, other failures aren't retried.
+
+    The status of each message (QUEUED, RETRYING, SENT or FAILED) is kept in
+    statuses, keyed by the id submit returns.
+    """
+    def __init__(self, mailer, statuses, workers=2, queue_size=1000, retries=3,
+                 retry_delay=1.0, pool_size=2, idle_timeout=60, clock=time.monotonic):
+        """
+        Arguments:
+        mailer -- pyramid_mailer Mailer for the server to send through, the
+                  connections of a PooledMailer are shared with it
+        statuses -- TTLCache to keep delivery statuses in
+
+        Keyword Arguments:
+        workers -- number of worker threads
+        queue_size -- maximum number of messages waiting to be sent
+        retries -- number of times a failed send is retried
+        retry_delay -- seconds before the first retry
+        pool_size -- maximum number of idle SMTP connections kept open
+        idle_timeout -- seconds an SMTP connection can be idle and be reused
+        clock -- function returning the current time in seconds
+        """
+        self.mailer = mailer
+        if isinstance(mailer, PooledMailer):
+            self.pool = mailer.pool
+        else:
+            self.pool = SMTPConnectionPool(
+                mailer.smtp_mailer, size=pool_size, idle_timeout=idle_timeout, clock=clock)
+        self.statuses = statuses
+        self.queue_size = queue_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.clock = clock
+        self.closed = False
+        self._ready = collections.deque()
+        self._delayed = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(
+                target=self._work, name="factored-mail-{}".format(i))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def __len__(self):
+        return len(self._ready) + len(self._delayed)
+
+    def submit(self, message):
+        """
+        Arguments:
+        message -- pyramid_mailer Message to send
+
+        Returns:
+        the id of the delivery, to look up its status with
+
+        Raises:
+        DeliveryQueueFull if queue_size messages are already waiting
+        """
+        delivery_id = uuid.uuid4().hex
+        with self._cond:
+            if self.closed or len(self) >= self.queue_size:
+                raise DeliveryQueueFull("mail delivery queue is full")
+            self.statuses.set(delivery_id, QUEUED)
+            self._ready.append((delivery_id, message, 0))
+            self._cond.notify()
+        return delivery_id
+
+    def close(self, timeout=None):
+        """
+        Stops the workers once the messages ready to be sent are sent, marks
+        the retries that aren't due yet FAILED, and closes the pooled
+        connections
+
+        Keyword Arguments:
+        timeout -- seconds to wait for each worker to stop
+        """
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+        with self._cond:
+            # retries that weren't due yet won't be sent
+            for _, _, (delivery_id, _, _) in self._delayed:
+                self.statuses.set(delivery_id, FAILED)
+            self._delayed = []
+        self.pool.close()
+
+    def _next(self):
+        with self._cond:
+            while True:
+                now = self.clock()
+                if self._delayed and self._delayed[0][0] <= now:
+                    return heapq.heappop(self._delayed)[2]
+                if self._ready:
+                    return self._ready.popleft()
+                if self.closed:
+                    return None
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._cond.wait(timeout)
+
+    def _work(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            delivery_id, message, attempt = item
+            try:
+                message.sender = message.sender or self.mailer.default_sender
+                self.pool.send(message.sender, message.send_to, message.to_message())
+            except Exception as ex:
+                if attempt >= self.retries or not is_transient(ex):
+                    logger.error("couldn't deliver message {}".format(delivery_id),
+                                 exc_info=True)
+                    self.statuses.set(delivery_id, FAILED)
+                    continue
+                logger.warning("couldn't deliver message {}, retrying".format(delivery_id),
+                               exc_info=True)
+                self.statuses.set(delivery_id, RETRYING)
+                due = self.clock() + self.retry_delay * (2 ** attempt)
+                with self._cond:
+                    heapq.heappush(
+                        self._delayed, (due, next(self._seq), (delivery_id, message, attempt + 1)))
+                    self._cond.notify()
+                continue
+            self.statuses.set(delivery_id, SENT)
+
+
+# mailers are shared by every app and plugin in the process
+_mailers = MailerRegistry()
+
+
+def get_mailer(settings, prefix="mail."):
+    """
+    Arguments:
+    settings -- settings with the mail settings, IE a plugin's settings
+
+    Keyword Arguments:
+    prefix -- prefix of the mail settings
+
+    Returns:
+    the shared PooledMailer for the settings, see MailerRegistry.get_mailer
+    """
+    return _mailers.get_mailer(settings, prefix=prefix)
+
+
+def mailer_stats():
+    """
+    Returns:
+    the stats of the shared mailers, see MailerRegistry.stats
+    """
+    return _mailers.stats()
+
+
+# delivery queues are shared by every app and plugin in the process, keyed by
+# the (normalized) mail settings they're for, like the mailers. Each queue has
+# its own worker threads, so only the most recently used MAX_DELIVERY_QUEUES
+# are kept, and the others are closed
+MAX_DELIVERY_QUEUES = 16
+_delivery_queues = collections.OrderedDict()
+_delivery_queues_lock = threading.Lock()
+_delivery_statuses = TTLCache(max_size=10000, ttl=600)
+
+
+def get_delivery_queue(settings, prefix="mail."):
+    """
+    Arguments:
+    settings -- settings with the mail settings, IE a plugin's settings
+
+    Keyword Arguments:
+    prefix -- prefix of the mail settings
+
+    Returns:
+    the DeliveryQueue for the mail settings, created the first time they're
+    used and configured with:
+
+      - "mail.async.workers" (default 2)
+      - "mail.async.queue_size" (default 1000)
+      - "mail.async.retries" (default 3)
+      - "mail.async.retry_delay" (default 1 second, doubled for each retry)
+
+    and sending through the mailer get_mailer returns for the settings. When
+    there are more than MAX_DELIVERY_QUEUES, the least recently used one is
+    closed in the background.
+    """
+    config = dict(
+        workers=_int_setting(settings, prefix + "async.workers", 2),
+        queue_size=_int_setting(settings, prefix + "async.queue_size", 1000),
+        retries=_int_setting(settings, prefix + "async.retries", 3),
+        retry_delay=_float_setting(settings, prefix + "async.retry_delay", 1.0))
+    key = (mailer_key(settings, prefix=prefix), frozenset(config.items()))
+    evicted = []
+    with _delivery_queues_lock:
+        delivery = _delivery_queues.get(key, None)
+        if delivery is not None:
+            _delivery_queues.move_to_end(key)
+            return delivery
+        delivery = DeliveryQueue(
+            get_mailer(settings, prefix=prefix), _delivery_statuses, **config)
+        _delivery_queues[key] = delivery
+        while len(_delivery_queues) > MAX_DELIVERY_QUEUES:
+            evicted.append(_delivery_queues.popitem(last=False)[1])
+    for queue in evicted:
+        # closing waits for the messages ready to be sent, so it isn't done
+        # in the request
+        threading.Thread(target=queue.close, name="factored-mail-close", daemon=True).start()
+    return delivery
+
+
+def close_delivery_queues(timeout=5):
+    """
+    Closes every delivery queue, sending the messages ready to be sent
+    first. It's run when the interpreter exits.
+
+    Keyword Arguments:
+    timeout -- seconds to wait for each worker to stop
+    """
+    with _delivery_queues_lock:
+        queues = list(_delivery_queues.values())
+        _delivery_queues.clear()
+    for queue in queues:
+        queue.close(timeout=timeout)
+
+
+atexit.register(close_delivery_queues)
+
+
+def send_async(settings, message, prefix="mail."):
+    """
+    Queues a message to be sent in the background
+
+    Arguments:
+    settings -- settings with the mail settings, IE a plugin's settings
+    message -- pyramid_mailer Message to send
+
+    Keyword Arguments:
+    prefix -- prefix of the mail settings
+
+    Returns:
+    the id of the delivery, see delivery_status
+
+    Raises:
+    DeliveryQueueFull if too many messages are waiting to be sent
+    """
+    delivery = get_delivery_queue(settings, prefix=prefix)
+    try:
+        return delivery.submit(message)
+    except DeliveryQueueFull:
+        if not delivery.closed:
+            raise
+    # the queue was closed since it was looked up, IE for being least
+    # recently used, so the message goes on a new one
+    return get_delivery_queue(settings, prefix=prefix).submit(message)
+
+
+def delivery_status(delivery_id):
+    """
+    Arguments:
+    delivery_id -- id returned by send_async
+
+    Returns:
+    QUEUED, RETRYING, SENT, FAILED, or None if the id isn't known (or the
+    delivery finished long enough ago to be forgotten)
+    """
+    return _delivery_statuses.get(delivery_id, None)
@@ -1,11 +1,18 @@
+import asyncio
+from collections import ChainMap, OrderedDict
+from collections.abc import Mapping
+import concurrent.futures
 import importlib
 import os
+import threading
 from yapsy.IPlugin import IPlugin
 from yapsy.PluginManager import PluginManager
 from yapsy.PluginFileLocator import PluginFileLocator
 from yapsy.PluginFileLocator import PluginFileAnalyzerMathingRegex
 from yapsy.PluginInfo import PluginInfo
 
+from factored.cache import TTLCache
+
 import logging
 logger = logging.getLogger("factored.plugins")
 
@@ -63,6 +70,161 @@ def get_manager(plugin_dirs=None, plugin_modules=None, load_defaults=True):
     return manager
 
 
+def _namespace_of(key):
+    # the namespace of a key is everything up to and including its second
+    # dot, IE "plugin.EMailAuth." for "plugin.EMailAuth.mail.host"
+    if not isinstance(key, str):
+        return None
+    first = key.find(".")
+    if first < 0:
+        return None
+    second = key.find(".", first + 1)
+    if second < 0:
+        return None
+    return key[:second + 1]
+
+
+def settings_fingerprint(settings):
+    """
+    Arguments:
+    settings -- dict of settings, typically the output of an ISettingsPlugin
+
+    Returns:
+    a hashable value that is equal for equal settings, or None if settings is
+    empty (IE nothing is layered over the app settings)
+    """
+    if not settings:
+        return None
+    try:
+        return frozenset(settings.items())
+    except TypeError:
+        # unhashable values, fall back on their repr
+        return frozenset((k, repr(v)) for k, v in settings.items())
+
+
+class SettingsIndex(Mapping):
+    """
+    SettingsIndex is a read-only view over a settings dict that groups the
+    settings by namespace (IE "plugin.<Name>.") up front, so looking up all
+    the settings for a plugin doesn't need to scan every key.
+    """
+    fingerprint = None
+
+    def __init__(self, settings):
+        """
+        Arguments:
+        settings -- dict of settings to index, not copied
+        """
+        self._settings = settings
+        self._namespaces = {}
+        for key, value in settings.items():
+            ns = _namespace_of(key)
+            if ns is not None:
+                self._namespaces.setdefault(ns, {})[key[len(ns):]] = value
+
+    def __getitem__(self, key):
+        return self._settings[key]
+
+    def __contains__(self, key):
+        return key in self._settings
+
+    def __iter__(self):
+        return iter(self._settings)
+
+    def __len__(self):
+        return len(self._settings)
+
+    def layer(self, settings):
+        """
+        Arguments:
+        settings -- dict of settings that take priority over this index
+
+        Returns:
+        a LayeredSettings of settings over this index, or this index if there
+        is nothing to layer
+        """
+        if not settings:
+            return self
+        return LayeredSettings(settings, self)
+
+    def namespace(self, prefix):
+        """
+        Arguments:
+        prefix -- prefix of the settings to return, IE "plugin.EMailAuth."
+
+        Returns:
+        a new dict of all the settings starting with prefix, with the prefix
+        trimmed from the keys
+        """
+        if _namespace_of(prefix) != prefix:
+            # not a namespace boundary, so it isn't indexed
+            return {k[len(prefix):]: self[k] for k in self if k.startswith(prefix)}
+        return dict(self._namespaces.get(prefix, {}))
+
+
+class LayeredSettings(ChainMap):
+    """
+    LayeredSettings is a ChainMap of request level settings (IE the output of
+    an ISettingsPlugin) over the app's SettingsIndex. Nothing is copied to
+    create it, and the request layer is only copied the first time it is
+    written to, so the dict returned by the settings plugin is never changed.
+
+    The fingerprint of the request layer identifies the settings for caching,
+    and is also used as the hash.
+    """
+    def __init__(self, settings, index):
+        """
+        Arguments:
+        settings -- dict of request settings that take priority
+        index -- the SettingsIndex of the app settings
+        """
+        super(LayeredSettings, self).__init__(settings, index)
+        self.index = index
+        self._request_index = None
+        self._fingerprint = None
+        self._copied = False
+
+    def __setitem__(self, key, value):
+        self._copy_on_write()
+        self.maps[0][key] = value
+
+    def __delitem__(self, key):
+        self._copy_on_write()
+        del self.maps[0][key]
+
+    def __hash__(self):
+        return hash(self.fingerprint)
+
+    def _copy_on_write(self):
+        if not self._copied:
+            self.maps[0] = dict(self.maps[0])
+            self._copied = True
+        self._request_index = None
+        self._fingerprint = None
+
+    @property
+    def fingerprint(self):
+        """
+        see settings_fingerprint, computed from the request layer only since
+        the app settings don't change
+        """
+        if self._fingerprint is None:
+            self._fingerprint = settings_fingerprint(self.maps[0])
+        return self._fingerprint
+
+    def namespace(self, prefix):
+        """
+        see SettingsIndex.namespace
+        """
+        if _namespace_of(prefix) != prefix:
+            return {k[len(prefix):]: self[k] for k in self if k.startswith(prefix)}
+        if self._request_index is None:
+            self._request_index = SettingsIndex(self.maps[0])
+        result = self.index.namespace(prefix)
+        result.update(self._request_index._namespaces.get(prefix, {}))
+        return result
+
+
 def get_plugin_settings(name_setting, allsettings, nolookup=False):
     """
     Arguments:
@@ -85,6 +247,8 @@ def get_plugin_settings(name_setting, allsettings, nolookup=False):
             logger.error("{pname} not configured".format(pname=name_setting))
             return None
         prefix = "plugin.{name}.".format(name=pname)
+    if isinstance(allsettings, (SettingsIndex, LayeredSettings)):
+        return allsettings.namespace(prefix)
     setting_keys = [k for k in allsettings.keys() if k.startswith(prefix)]
     plugin_settings = {}
     for key in setting_keys:
@@ -133,6 +297,455 @@ def get_plugin(name_setting, category, allsettings, plugin_manager, nolookup=Fal
     return (p, p_settings)
 
 
+class CachedFinder(object):
+    """
+    CachedFinder wraps an IFinderPlugin so is_valid_subject is only called on
+    the plugin when there is no live cached answer for the (host, subject).
+    Valid and invalid answers have their own time to live, so an invalid
+    subject can be given a short one, and the least recently used answers
+    are evicted once max_size answers are cached.
+
+    Anything besides is_valid_subject is passed through to the wrapped plugin.
+    """
+    def __init__(self, finder, positive_ttl=60, negative_ttl=10, max_size=10000):
+        """
+        Arguments:
+        finder -- the IFinderPlugin instance to wrap
+
+        Keyword Arguments:
+        positive_ttl -- seconds a valid subject is cached, 0 to not cache them
+        negative_ttl -- seconds an invalid subject is cached, 0 to not cache them
+        max_size -- maximum number of (host, subject) answers cached
+        """
+        self.finder = finder
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(max_size=max_size, ttl=positive_ttl)
+
+    def __getattr__(self, name):
+        return getattr(self.finder, name)
+
+    def is_valid_subject(self, host, sub):
+        """
+        see IFinderPlugin.is_valid_subject
+        """
+        key = (host, sub)
+        valid = self.cache.get(key, None)
+        if valid is None:
+            valid = bool(self.finder.is_valid_subject(host, sub))
+            self.cache.set(key, valid, ttl=self.positive_ttl if valid else self.negative_ttl)
+        return valid
+
+    def stats(self):
+        """
+        see TTLCache.stats
+        """
+        return self.cache.stats()
+
+
+class PluginResolver(object):
+    """
+    PluginResolver caches the results of get_plugin so resolving a plugin for
+    a request is a dict lookup instead of a scan over all the settings.
+
+    Resolved plugins are keyed by (category, plugin name, settings fingerprint)
+    where the fingerprint identifies the ISettingsPlugin output the plugin
+    settings were built from. Hosts are tracked against the fingerprint of
+    their settings, and cached entries for a fingerprint are dropped once no
+    host uses it anymore. At most "plugins.resolver.max_hosts" (default
+    10000) hosts are tracked, the ones tracked first are dropped to make
+    room, since any Host header can be sent.
+    """
+    def __init__(self, plugin_manager, settings):
+        """
+        Arguments:
+        plugin_manager -- the PluginManager plugins are resolved from
+        settings -- the app settings, indexed as a SettingsIndex
+        """
+        self.plugin_manager = plugin_manager
+        self.settings = SettingsIndex(settings)
+        try:
+            self.max_hosts = int(settings.get("plugins.resolver.max_hosts", 10000))
+        except Exception:
+            logger.error("failed to get plugins.resolver.max_hosts config", exc_info=True)
+            self.max_hosts = 10000
+        self._plugins = {}
+        self._hosts = OrderedDict()
+        self._refs = {}
+        self._settings_plugins = {}
+        self._finders = {}
+        self._lock = threading.Lock()
+
+    def track(self, host, settings):
+        """
+        Arguments:
+        host -- the host the request is being made too
+        settings -- the LayeredSettings (or SettingsIndex) for the request
+
+        Returns:
+        the fingerprint of the settings
+        """
+        fingerprint = settings.fingerprint
+        previous = self._hosts.get(host, None)
+        if previous == fingerprint:
+            return fingerprint
+
+        with self._lock:
+            previous = self._hosts.pop(host, None)
+            if fingerprint is not None:
+                self._hosts[host] = fingerprint
+                self._refs[fingerprint] = self._refs.get(fingerprint, 0) + 1
+            if previous is not None:
+                self._release(previous)
+            while len(self._hosts) > self.max_hosts:
+                _, oldest = self._hosts.popitem(last=False)
+                self._release(oldest)
+        return fingerprint
+
+    def get_request_settings(self, settings_plugin, host):
+        """
+        Arguments:
+        settings_plugin -- PluginInfo of the ISettingsPlugin, as returned by
+                           get_plugin("plugins.settings", "settings", ...)
+        host -- the host the request is being made too
+
+        Returns:
+        the request settings for host, through a CachedSettingsPlugin
+        configured by the "plugins.settings.cache.ttl" and
+        "plugins.settings.cache.max_size" app settings
+        """
+        cached = self._settings_plugins.get(settings_plugin.name, None)
+        if cached is None:
+            try:
+                ttl = int(self.settings.get("plugins.settings.cache.ttl", 30))
+                max_size = int(self.settings.get("plugins.settings.cache.max_size", 1000))
+            except Exception:
+                logger.error("failed to get plugins.settings.cache config", exc_info=True)
+                ttl = 30
+                max_size = 1000
+            cached = CachedSettingsPlugin(settings_plugin.plugin_object, ttl=ttl, max_size=max_size)
+            with self._lock:
+                cached = self._settings_plugins.setdefault(settings_plugin.name, cached)
+        return cached.get_request_settings(host)
+
+    def get_finder(self, finder, finder_settings):
+        """
+        Arguments:
+        finder -- PluginInfo of the IFinderPlugin, as returned by get_plugin
+        finder_settings -- the settings for the finder, as returned by get_plugin
+
+        Returns:
+        a CachedFinder around the finder's plugin_object, configured by the
+        finder's "cache.positive_ttl" (default 60), "cache.negative_ttl"
+        (default 10) and "cache.max_size" (default 10000) settings, IE
+        "plugin.EMailDomain.cache.positive_ttl"
+        """
+        try:
+            config = (
+                int(finder_settings.get("cache.positive_ttl", 60)),
+                int(finder_settings.get("cache.negative_ttl", 10)),
+                int(finder_settings.get("cache.max_size", 10000)))
+        except Exception:
+            logger.error("failed to get cache config for {}".format(finder.name), exc_info=True)
+            config = (60, 10, 10000)
+
+        key = (finder.name, config)
+        cached = self._finders.get(key, None)
+        if cached is None:
+            cached = CachedFinder(finder.plugin_object, *config)
+            with self._lock:
+                cached = self._finders.setdefault(key, cached)
+        return cached
+
+    def resolved_plugins(self, category):
+        """
+        Arguments:
+        category -- the plugin category, IE "datastore"
+
+        Returns:
+        list of the distinct PluginInfo objects of category resolved so far,
+        for the app settings or any host's settings
+        """
+        with self._lock:
+            infos = [v[0] for k, v in self._plugins.items()
+                     if k[0] == category and v[0] is not None]
+        return list(dict((info.name, info) for info in infos).values())
+
+    def _release(self, fingerprint):
+        refs = self._refs.get(fingerprint, 0) - 1
+        if refs > 0:
+            self._refs[fingerprint] = refs
+            return
+        self._refs.pop(fingerprint, None)
+        stale = [k for k in self._plugins if k[2] == fingerprint]
+        for key in stale:
+            del self._plugins[key]
+
+    def get_plugin(self, name_setting, category, allsettings, nolookup=False):
+        """
+        Same as get_plugin, but cached when allsettings are the app settings or
+        LayeredSettings over them.
+
+        Arguments:
+        name_setting -- see get_plugin
+        category -- see get_plugin
+        allsettings -- see get_plugin
+
+        Keyword Arguments:
+        nolookup -- see get_plugin
+
+        Returns:
+        see get_plugin
+        """
+        if isinstance(allsettings, LayeredSettings):
+            fingerprint = allsettings.fingerprint
+        elif allsettings is self.settings or allsettings is self.settings._settings:
+            fingerprint = None
+        else:
+            # unknown settings, there's nothing to key a cache entry on
+            return get_plugin(name_setting, category, allsettings,
+                              self.plugin_manager, nolookup=nolookup)
+
+        if nolookup:
+            p_name = name_setting
+        else:
+            p_name = allsettings.get(name_setting, None)
+            if p_name is None:
+                return (None, None)
+
+        key = (category, p_name, fingerprint)
+        resolved = self._plugins.get(key, None)
+        if resolved is None:
+            resolved = get_plugin(p_name, category, allsettings, self.plugin_manager, nolookup=True)
+            with self._lock:
+                if fingerprint is None or fingerprint in self._refs:
+                    self._plugins[key] = resolved
+        # every caller gets its own copy of the settings, so a plugin changing
+        # them doesn't change them for later requests
+        plugin, p_settings = resolved
+        if p_settings is not None:
+            p_settings = dict(p_settings)
+        return (plugin, p_settings)
+
+
+class CachedSettingsPlugin(object):
+    """
+    CachedSettingsPlugin wraps an ISettingsPlugin so get_request_settings is
+    only called on the plugin when there is no live cached result for the
+    host. Entries live for ttl seconds, and the least recently used hosts are
+    evicted once max_size hosts are cached.
+
+    The settings plugin can drop cached entries early by calling its
+    invalidate_request_settings method.
+    """
+    def __init__(self, plugin, ttl=30, max_size=1000):
+        """
+        Arguments:
+        plugin -- the ISettingsPlugin instance to wrap
+
+        Keyword Arguments:
+        ttl -- seconds the settings for a host are cached for, 0 to disable
+        max_size -- maximum number of hosts cached
+        """
+        self.plugin = plugin
+        self.cache = TTLCache(max_size=max_size, ttl=ttl)
+        caches = getattr(plugin, "_settings_caches", None)
+        if caches is None:
+            caches = plugin._settings_caches = []
+        caches.append(self.cache)
+
+    def get_request_settings(self, host):
+        """
+        see ISettingsPlugin.get_request_settings
+        """
+        settings = self.cache.get(host, None)
+        if settings is None:
+            settings = self.plugin.get_request_settings(host)
+            self.cache.set(host, settings)
+        return settings
+
+    def invalidate(self, host=None):
+        """
+        Keyword Arguments:
+        host -- the host to drop cached settings for, None for all hosts
+        """
+        self.cache.invalidate(host)
+
+
+def get_resolver(settings):
+    """
+    Arguments:
+    settings -- the app settings, with "plugins.manager" configured
+
+    Returns:
+    the PluginResolver for the app, created and stored as "plugins.resolver" in
+    settings if the app didn't already set one up
+    """
+    resolver = settings.get("plugins.resolver", None)
+    if resolver is None:
+        resolver = PluginResolver(settings.get("plugins.manager", None), settings)
+        settings["plugins.resolver"] = resolver
+    return resolver
+
+
+class ExecutorBusy(Exception):
+    pass
+
+
+class PluginExecutor(object):
+    """
+    PluginExecutor runs CPU bound work for plugins, IE hashing codes, on a
+    pool of threads or processes rather than on the thread handling the
+    request. At most max_pending tasks can be running or waiting at once;
+    submitting more raises ExecutorBusy instead of queueing them, as does a
+    result taking longer than timeout seconds.
+
+    A kind of "inline" runs tasks in the calling thread, as if there was no
+    executor.
+    """
+    KINDS = ("thread", "process", "inline")
+
+    def __init__(self, kind="thread", workers=4, max_pending=32, timeout=10):
+        """
+        Keyword Arguments:
+        kind -- "thread", "process" or "inline"
+        workers -- number of threads or processes
+        max_pending -- maximum number of tasks running or waiting at once
+        timeout -- seconds run waits for a result
+        """
+        if kind not in self.KINDS:
+            raise ValueError("unknown executor kind {}".format(kind))
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.submitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        if kind == "thread":
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="factored-executor")
+        elif kind == "process":
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+
+    def stats(self):
+        """
+        Returns:
+        dict of the number of tasks submitted, rejected for there being too
+        many pending, and timed out
+        """
+        return {
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Arguments:
+        fn -- the function to call, for a process pool it and its arguments
+              must be picklable, IE hashlib.pbkdf2_hmac
+
+        Returns:
+        a concurrent.futures.Future of the result
+
+        Raises:
+        ExecutorBusy if max_pending tasks are already pending
+        """
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise ExecutorBusy("too many pending tasks")
+        self.submitted += 1
+        if self._executor is None:
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as ex:
+                future.set_exception(ex)
+            finally:
+                self._slots.release()
+            return future
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Submits fn and waits for its result
+
+        Arguments:
+        fn -- the function to call
+
+        Returns:
+        the result of fn
+
+        Raises:
+        ExecutorBusy if there are too many pending tasks, or the result takes
+        longer than timeout seconds
+        """
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            self.timeouts += 1
+            future.cancel()
+            raise ExecutorBusy("timed out waiting for task")
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+
+# executors are shared by every app and plugin in the process, keyed by their
+# configuration
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(settings, prefix="executor."):
+    """
+    Arguments:
+    settings -- plugin settings
+
+    Keyword Arguments:
+    prefix -- prefix of the executor settings
+
+    Returns:
+    the shared PluginExecutor for the settings, configured with
+    "executor.kind" (default "thread"), "executor.workers" (default 4),
+    "executor.max_pending" (default 32) and "executor.timeout" (default 10
+    seconds)
+    """
+    kind = settings.get(prefix + "kind", "thread").strip().lower()
+    try:
+        workers = int(settings.get(prefix + "workers", 4))
+        max_pending = int(settings.get(prefix + "max_pending", 32))
+        timeout = float(settings.get(prefix + "timeout", 10))
+    except Exception:
+        logger.error("failed to get {}* config".format(prefix), exc_info=True)
+        workers, max_pending, timeout = 4, 32, 10
+    if kind not in PluginExecutor.KINDS:
+        logger.error("unknown {}kind {}, using thread".format(prefix, kind))
+        kind = "thread"
+
+    key = (kind, workers, max_pending, timeout)
+    executor = _executors.get(key, None)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(key, None)
+            if executor is None:
+                executor = PluginExecutor(
+                    kind=kind, workers=workers, max_pending=max_pending, timeout=timeout)
+                _executors[key] = executor
+    return executor
+
+
 class IFinderPlugin(IPlugin):
     """
     IFinderPlugin's are used primarily in the factored.validator for the express
@@ -194,6 +807,21 @@ class IAuthenticatorPlugin(IPlugin):
         """
         raise NotImplemented()
 
+    def busy(self, host, settings, params, message):
+        """
+        Arguments:
+        host -- the host the request is being made too
+        settings -- dict of key-value config specific to the plugin
+        params -- a dict of values from the combined GET and POST of the form
+        message -- the error to show the user
+
+        Returns:
+        a dict of values passed as the **kwargs of the render method call
+        when 'template()' is rendered, in place of the result of handle when
+        the plugin's executor was too busy to run it
+        """
+        return {"err": message}
+
     def template(self, host, settings, params):
         """
         Arguments:
@@ -279,9 +907,23 @@ class ITemplatePlugin(IPlugin):
 
         this template is referred to as "base.html" for extending/overriding
         purposes in IAuthenticatorPlugin templates
+
+        the urls of the static_assets are available to the template as
+        "assets", IE {{ assets['default.css'] }}
         """
         raise NotImplemented()
 
+    def static_assets(self):
+        """
+        Returns:
+        a dict of name to (content type, content) of static files, IE css,
+        that the authenticator should serve for templates of this plugin. The
+        content is a str (encoded as utf-8) or bytes, and shouldn't change
+        while the app is running, since it's served with long lived caching
+        headers.
+        """
+        return {}
+
 
 class IDataStorePlugin(IPlugin):
     """
@@ -329,6 +971,106 @@ class IDataStorePlugin(IPlugin):
         """
         raise NotImplemented()
 
+    def purge_expired(self, before_timestamp):
+        """
+        deletes all access requests, for any host and subject, stored before
+        before_timestamp. Data stores that can't do this don't have to, the
+        default does nothing.
+
+        Arguments:
+        before_timestamp -- the timestamp (as passed to store_access_request)
+                            requests stored before are deleted
+
+        Returns:
+        the number of access requests deleted
+        """
+        return 0
+
+    def get_async(self, settings):
+        """
+        Arguments:
+        settings -- dict of key-value config specific to the plugin
+
+        Returns:
+        an IAsyncDataStore for the data store. By default a ThreadPoolDataStore
+        running the blocking methods on the shared thread executor configured
+        by the "executor.*" settings, see get_executor. Plugins with a native
+        async client can return their own.
+        """
+        return ThreadPoolDataStore(self, get_executor(settings))
+
+
+class IAsyncDataStore(object):
+    """
+    IAsyncDataStore is the async variant of the IDataStorePlugin methods,
+    for authenticators running on an event loop (IE under ASGI) where a
+    blocking data store call would hold up every other request. Get one from
+    a data store plugin with IDataStorePlugin.get_async.
+    """
+    async def store_access_request(self, host, subject, timestamp, payload):
+        """
+        see IDataStorePlugin.store_access_request
+        """
+        raise NotImplementedError()
+
+    async def get_access_request(self, host, subject):
+        """
+        see IDataStorePlugin.get_access_request
+        """
+        raise NotImplementedError()
+
+    async def delete_access_requests(self, host, subject):
+        """
+        see IDataStorePlugin.delete_access_requests
+        """
+        raise NotImplementedError()
+
+    async def purge_expired(self, before_timestamp):
+        """
+        see IDataStorePlugin.purge_expired
+        """
+        raise NotImplementedError()
+
+
+class ThreadPoolDataStore(IAsyncDataStore):
+    """
+    ThreadPoolDataStore adapts a blocking IDataStorePlugin to IAsyncDataStore
+    by running its methods on a PluginExecutor, so a few event loop threads
+    can wait on many data store calls at once. Calls raise ExecutorBusy when
+    the executor has too many pending calls, or a call takes longer than
+    its timeout. The executor has to be a "thread" (or "inline") one, since
+    plugin methods can't be sent to other processes.
+    """
+    def __init__(self, datastore, executor):
+        """
+        Arguments:
+        datastore -- the IDataStorePlugin object
+        executor -- the PluginExecutor to run its methods on
+        """
+        self.datastore = datastore
+        self.executor = executor
+
+    async def _run(self, fn, *args):
+        future = asyncio.wrap_future(self.executor.submit(fn, *args))
+        try:
+            return await asyncio.wait_for(future, self.executor.timeout)
+        except asyncio.TimeoutError:
+            self.executor.timeouts += 1
+            raise ExecutorBusy("timed out waiting for task")
+
+    async def store_access_request(self, host, subject, timestamp, payload):
+        return await self._run(
+            self.datastore.store_access_request, host, subject, timestamp, payload)
+
+    async def get_access_request(self, host, subject):
+        return await self._run(self.datastore.get_access_request, host, subject)
+
+    async def delete_access_requests(self, host, subject):
+        return await self._run(self.datastore.delete_access_requests, host, subject)
+
+    async def purge_expired(self, before_timestamp):
+        return await self._run(self.datastore.purge_expired, before_timestamp)
+
 
 class ISettingsPlugin(IPlugin):
     """
@@ -344,5 +1086,20 @@ class ISettingsPlugin(IPlugin):
         a dict (empty or otherwise) of all settings that should take priority
         for a request. They are applied over and along side the app settings
         every request.
+
+        The result is cached per host for "plugins.settings.cache.ttl" seconds
+        (30 by default), see invalidate_request_settings.
         """
         raise NotImplemented()
+
+    def invalidate_request_settings(self, host=None):
+        """
+        Drops any cached result of get_request_settings, so the next request
+        calls get_request_settings again. Call this when the settings for a
+        host change.
+
+        Keyword Arguments:
+        host -- the host to invalidate, or None to invalidate every host
+        """
+        for cache in getattr(self, "_settings_caches", []):
+            cache.invalidate(host)
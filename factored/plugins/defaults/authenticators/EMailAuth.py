@@ -1,21 +1,68 @@
 import binascii
 from datetime import datetime, timedelta
 import hashlib
+import hmac
 import os
 import time
 import json
 
-from pyramid_mailer.mailer import Mailer
 from pyramid_mailer.message import Message
 
-from factored.mail import create_message_id
-from factored.plugins import IAuthenticatorPlugin
+from factored.mail import create_message_id, get_mailer, send_async, DeliveryQueueFull
+from factored.plugins import ExecutorBusy, get_executor, IAuthenticatorPlugin
 
 import logging
 logger = logging.getLogger("factored.plugins")
 auditlog = logging.getLogger('factored.audit')
 
 
+# the number of pbkdf2 iterations of hashes stored without a scheme
+LEGACY_ITERATIONS = 100000
+
+
+def pbkdf2_code_hash(code, salt, params, executor):
+    return executor.run(hashlib.pbkdf2_hmac, "sha256", code, salt, int(params))
+
+
+def scrypt_code_hash(code, salt, params, executor):
+    n, r, p = (int(x) for x in params.split(","))
+    # allow twice the memory the params need, the default limit is 32MiB
+    return executor.run(hashlib.scrypt, code, salt=salt, n=n, r=r, p=p, maxmem=256 * n * r)
+
+
+# scrypt params code_hash_scheme already tried a hash with
+_checked_scrypt_params = set()
+
+
+def check_scrypt_params(params):
+    """
+    Arguments:
+    params -- "n,r,p" params of scrypt_code_hash
+
+    Raises:
+    ValueError if hashlib.scrypt refuses the params, IE n isn't a power of 2
+    """
+    if params not in _checked_scrypt_params:
+        n, r, p = (int(x) for x in params.split(","))
+        hashlib.scrypt(b"", salt=b"", n=n, r=r, p=p, maxmem=256 * n * r)
+        _checked_scrypt_params.add(params)
+
+
+def hmac_code_hash(code, secret, params, executor):
+    # cheap enough that handing it to the executor would cost more
+    return hmac.new(secret, code, params).digest()
+
+
+# code hashes by scheme name, each called with the code, the salt (or secret
+# for hmac), the params string stored with the hash and the PluginExecutor to
+# run expensive hashing on
+CODE_HASHES = {
+    "pbkdf2": pbkdf2_code_hash,
+    "scrypt": scrypt_code_hash,
+    "hmac": hmac_code_hash,
+}
+
+
 class CodeTimeoutError(Exception):
     pass
 
@@ -37,16 +84,94 @@ class EMailAuth(IAuthenticatorPlugin):
     def display_name(self):
         return "Email"
 
-    def get_code_hash(self, settings, code):
-        salt = str.encode(settings.get("code_hash_salt", "7pLPnGtXI9"))
-        bcode = str.encode(code)
+    def code_hash_scheme(self, settings):
+        """
+        Arguments:
+        settings -- plugin settings
+
+        Returns:
+        (scheme, params) of the code hash configured by "code_hash.scheme",
+        see CODE_HASHES, or pbkdf2 if the scheme or its params are invalid,
+        IE an unknown hmac digest or scrypt params hashlib refuses
+        """
+        scheme = settings.get("code_hash.scheme", "pbkdf2").strip().lower()
+        try:
+            if scheme == "pbkdf2":
+                return scheme, str(int(settings.get("code_hash.iterations", 100000)))
+            if scheme == "scrypt":
+                params = "{},{},{}".format(
+                    int(settings.get("code_hash.scrypt_n", 16384)),
+                    int(settings.get("code_hash.scrypt_r", 8)),
+                    int(settings.get("code_hash.scrypt_p", 1)))
+                check_scrypt_params(params)
+                return scheme, params
+            if scheme == "hmac":
+                if settings.get("code_hash.secret", None) is None:
+                    raise ValueError("code_hash.secret not configured")
+                digest = settings.get("code_hash.digest", "sha256").strip().lower()
+                # raises ValueError for a digest hashlib doesn't have
+                hashlib.new(digest)
+                return scheme, digest
+            raise ValueError("unknown code_hash.scheme {}".format(scheme))
+        except Exception:
+            logger.error("failed to get code_hash config, using pbkdf2", exc_info=True)
+            return "pbkdf2", str(LEGACY_ITERATIONS)
+
+    def get_code_hash(self, settings, code, scheme=None, params=None):
+        """
+        Arguments:
+        settings -- plugin settings
+        code -- the code to hash
+
+        Keyword Arguments:
+        scheme -- name of the hash in CODE_HASHES, the configured one if None
+        params -- params of the hash, IE the pbkdf2 iterations
+
+        Returns:
+        storable "<scheme>$<params>$<hex hash>" of the code
+
+        Raises:
+        ExecutorBusy if the executor for hashing has too much work already
+        """
+        if scheme is None:
+            scheme, params = self.code_hash_scheme(settings)
+        if scheme == "hmac":
+            key = settings.get("code_hash.secret", "")
+        else:
+            key = settings.get("code_hash_salt", "7pLPnGtXI9")
         codehash = binascii.hexlify(
-            hashlib.pbkdf2_hmac(
-                "sha256",
-                bcode,
-                salt,
-                100000))
-        return codehash.decode('utf-8')
+            CODE_HASHES[scheme](str.encode(code), str.encode(key), params, get_executor(settings)))
+        return "{}${}${}".format(scheme, params, codehash.decode('utf-8'))
+
+    def check_code_hash(self, settings, code, payload):
+        """
+        Arguments:
+        settings -- plugin settings
+        code -- the code that was entered
+        payload -- the stored get_code_hash of the code that was sent, or
+                   the plain hex pbkdf2 hash stored by older versions
+
+        Returns:
+        True if code matches, hashed with the scheme and params of payload
+        so that changing the configured scheme doesn't break codes that were
+        already sent
+        """
+        if "$" in payload:
+            scheme, params, _ = payload.split("$", 2)
+        else:
+            scheme, params = "pbkdf2", str(LEGACY_ITERATIONS)
+            payload = "{}${}${}".format(scheme, params, payload)
+        if scheme not in CODE_HASHES:
+            logger.error("unknown code hash scheme {}".format(scheme))
+            return False
+        try:
+            codehash = self.get_code_hash(settings, code, scheme, params)
+        except ExecutorBusy:
+            raise
+        except Exception:
+            logger.error("couldn't hash code with {}".format(scheme), exc_info=True)
+            return False
+        return hmac.compare_digest(codehash, payload)
 
     def generate_and_send_code(self, host, settings, params, datastore, subject):
         # note: hexlify will generate 2 ascii chars for each byte, so the
@@ -79,7 +204,20 @@ class EMailAuth(IAuthenticatorPlugin):
             extra_headers={
                 "Message-ID": create_message_id(domain=msgdomain),
             })
-        mailer = Mailer.from_settings(settings)
+
+        # with "mail.async" the code is sent in the background, and the id of
+        # the delivery is returned so its status can be checked
+        if settings.get("mail.async", "false").strip().lower() == "true":
+            try:
+                delivery_id = send_async(settings, message)
+            except DeliveryQueueFull:
+                logger.error("couldn't queue code", exc_info=True)
+                raise CodeSendingError("Too many codes are being sent right now. "
+                                       "Please try again in a moment.")
+            auditlog.info("code queued => {sub}".format(sub=subject))
+            return delivery_id
+
+        mailer = get_mailer(settings)
         try:
             mailer.send_immediately(message, fail_silently=False)
             auditlog.info("code sent => {sub}".format(sub=subject))
@@ -87,6 +225,7 @@ class EMailAuth(IAuthenticatorPlugin):
             logger.error("couldn't mail code", exc_info=True)
             raise CodeSendingError("Problem sending code. Please try again, "
                                    "or contact an administrator.")
+        return None
 
     #
     # will raise exception on invalid code
@@ -114,11 +253,17 @@ class EMailAuth(IAuthenticatorPlugin):
             raise CodeTimeoutError("Your code timed out, please try again.")
 
         # do the codes match?
-        codehash = self.get_code_hash(settings, code)
-        if codehash != stored_payload:
+        if not self.check_code_hash(settings, code, stored_payload):
             auditlog.info("{} had code mismatch".format(subject))
             raise CodeIncorrectError("Incorrect code.")
 
+    def busy(self, host, settings, params, message):
+        # keep the email, so a code can still be submitted for it
+        return {
+            "err": message,
+            "email": params.get("email", ""),
+        }
+
     def handle(self, host, settings, params, datastore, finder):
         submit = params.get("submit", None)
         subject = params.get("email", None)
@@ -136,9 +281,11 @@ class EMailAuth(IAuthenticatorPlugin):
                 auditlog.info("{} ** invalid user".format(subject))
             else:
                 try:
-                    self.generate_and_send_code(
+                    delivery_id = self.generate_and_send_code(
                         host, settings, params, datastore, subject)
                     results["subject"] = subject
+                    if delivery_id is not None:
+                        results["delivery_id"] = delivery_id
                 except CodeSendingError as ex:
                     error = str(ex)
 
@@ -1,23 +1,171 @@
+from collections import OrderedDict
+import sys
+import threading
+import time
+
 from factored.plugins import IDataStorePlugin
 
+import logging
+logger = logging.getLogger("factored.plugins")
+
+
+class AccessRecord(object):
+    """
+    an access request stored by MemDataStore, tick is the timing wheel tick
+    the record expires at (None if it never does)
+    """
+    __slots__ = ("host", "subject", "timestamp", "payload", "tick")
+
+    def __init__(self, host, subject, timestamp, payload, tick):
+        self.host = host
+        self.subject = subject
+        self.timestamp = timestamp
+        self.payload = payload
+        self.tick = tick
+
 
 class MemDataStore(IDataStorePlugin):
+    """
+    Keeps access requests in memory, keyed by (host, subject), for single
+    process deployments. Configured with "max_entries" (default 100000),
+    after which the least recently used requests are evicted, and "ttl"
+    (default 300 seconds, the default EMailAuth "code_timeout", so it should
+    be at least the longest code_timeout configured), the seconds after its
+    timestamp a request expires, 0 keeps requests until they're purged.
+
+    Expiry uses a timing wheel with a slot per "tick" of "resolution" seconds
+    (default 1), so expiring a request is O(1) rather than a search of every
+    stored request.
+    """
     def initialize(self, settings):
-        self.data = {}
+        try:
+            max_entries = int(settings.get("max_entries", 100000))
+            ttl = float(settings.get("ttl", 300))
+            resolution = float(settings.get("resolution", 1))
+        except Exception:
+            logger.error("failed to get MemDataStore config", exc_info=True)
+            max_entries = 100000
+            ttl = 300
+            resolution = 1
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.resolution = resolution
+        self.clock = time.time
+        self.data = OrderedDict()
+        self.wheel = [set() for _ in range(int(ttl // resolution) + 2 if ttl > 0 else 0)]
+        self.last_tick = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.purged = 0
+        self.lock = threading.Lock()
+
+    def _tick(self, timestamp):
+        return int(timestamp // self.resolution)
+
+    def _unlink(self, key, record):
+        # removes the record's key from the wheel slot it expires in
+        if record.tick is not None:
+            self.wheel[record.tick % len(self.wheel)].discard(key)
+
+    def _advance(self):
+        # expires the records in the slots of the ticks since the last call,
+        # keeping records that belong to a later turn of the wheel
+        now = self._tick(self.clock())
+        if self.last_tick is None or not self.wheel:
+            self.last_tick = now
+            return
+        ticks = min(now - self.last_tick, len(self.wheel))
+        for tick in range(now - ticks + 1, now + 1):
+            slot = self.wheel[tick % len(self.wheel)]
+            for key in [k for k in slot if self.data[k].tick <= now]:
+                slot.discard(key)
+                del self.data[key]
+                self.expired += 1
+        self.last_tick = max(self.last_tick, now)
 
     def store_access_request(self, host, subject, timestamp, payload):
-        self.delete_access_requests(host, subject)
-        self.data[host+subject] = dict(host=host, subject=subject, timestamp=timestamp, payload=payload)
+        key = (host, subject)
+        tick = self._tick(timestamp + self.ttl) if self.wheel else None
+        with self.lock:
+            self._advance()
+            record = self.data.pop(key, None)
+            if record is not None:
+                self._unlink(key, record)
+            if tick is not None and tick <= self.last_tick:
+                # already expired
+                self.expired += 1
+                return
+            self.data[key] = AccessRecord(host, subject, timestamp, payload, tick)
+            if tick is not None:
+                self.wheel[tick % len(self.wheel)].add(key)
+            while len(self.data) > self.max_entries:
+                key, record = self.data.popitem(last=False)
+                self._unlink(key, record)
+                self.evictions += 1
 
     def get_access_request(self, host, subject):
-        try:
-            ar = self.data[host+subject]
-            return (ar["host"], ar["subject"], ar["timestamp"], ar["payload"])
-        except KeyError:
-            return None
+        key = (host, subject)
+        with self.lock:
+            self._advance()
+            record = self.data.get(key, None)
+            if record is None or (record.tick is not None and record.tick <= self.last_tick):
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return (record.host, record.subject, record.timestamp, record.payload)
 
     def delete_access_requests(self, host, subject):
-        try:
-            del self.data[host+subject]
-        except KeyError:
-            pass
+        key = (host, subject)
+        with self.lock:
+            record = self.data.pop(key, None)
+            if record is not None:
+                self._unlink(key, record)
+
+    def purge_expired(self, before_timestamp):
+        purged = 0
+        with self.lock:
+            self._advance()
+            if self.wheel:
+                # requests stored before before_timestamp expire before
+                # before_timestamp + ttl, so only those slots are looked at
+                last = min(self._tick(before_timestamp + self.ttl),
+                           self.last_tick + len(self.wheel))
+                slots = [self.wheel[t % len(self.wheel)] for t in range(self.last_tick + 1, last + 1)]
+                keys = [k for slot in slots for k in slot]
+            else:
+                keys = list(self.data)
+            for key in keys:
+                record = self.data.get(key, None)
+                if record is not None and record.timestamp < before_timestamp:
+                    self._unlink(key, record)
+                    del self.data[key]
+                    purged += 1
+            self.purged += purged
+        return purged
+
+    def stats(self):
+        """
+        Returns:
+        dict of the number of stored requests, the maximum, the hits, misses,
+        evictions, expired and purged requests, and an estimate of the bytes
+        used by the stored requests
+        """
+        with self.lock:
+            memory = sys.getsizeof(self.data) + sum(sys.getsizeof(s) for s in self.wheel)
+            for key, record in self.data.items():
+                memory += sys.getsizeof(key) + sys.getsizeof(record)
+                memory += sys.getsizeof(record.host) + sys.getsizeof(record.subject)
+                memory += sys.getsizeof(record.payload)
+            return {
+                "entries": len(self.data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "purged": self.purged,
+                "memory": memory,
+            }
@@ -0,0 +1,132 @@
+import hashlib
+
+from factored.plugins import IDataStorePlugin
+from factored.resp import RESPClient
+
+import logging
+logger = logging.getLogger("factored.plugins")
+
+
+FIELDS = ("host", "subject", "timestamp", "payload")
+
+
+class RedisDataStore(IDataStorePlugin):
+    """
+    Stores access requests in Redis (or anything speaking its protocol), so
+    they're shared by authenticators on any number of hosts. Configured with
+    "host" (default localhost), "port" (default 6379), "db" (default 0),
+    "password", "unix_socket", "pool_size" (default 4 pooled connections),
+    "timeout" (default 5 seconds) and "key_prefix" (default "factored:").
+
+    Each access request is a hash that Redis expires itself "ttl" seconds
+    after its timestamp (default 300, the default EMailAuth code_timeout, so
+    it should be at least the longest code_timeout configured). Requests are
+    also indexed by timestamp in a sorted set, for purge_expired. Storing a
+    request drops the requests older than the ttl from the index and expires
+    the index with the request, so the index stays bounded without sweeps.
+    """
+    def initialize(self, settings):
+        try:
+            port = int(settings.get("port", 6379))
+            db = int(settings.get("db", 0))
+            pool_size = int(settings.get("pool_size", 4))
+            timeout = float(settings.get("timeout", 5))
+            ttl = float(settings.get("ttl", 300))
+        except Exception:
+            logger.error("failed to get RedisDataStore config", exc_info=True)
+            port = 6379
+            db = 0
+            pool_size = 4
+            timeout = 5
+            ttl = 300
+        self.ttl = ttl
+        self.key_prefix = settings.get("key_prefix", "factored:")
+        self.index = self.key_prefix + "access_requests"
+        self.client = RESPClient(
+            host=settings.get("host", "localhost"),
+            port=port,
+            db=db,
+            password=settings.get("password", None),
+            unix_socket=settings.get("unix_socket", None),
+            pool_size=pool_size,
+            timeout=timeout)
+
+    def key(self, host, subject):
+        """
+        Returns:
+        the key of the access request of host and subject
+        """
+        digest = hashlib.sha256("{}\0{}".format(host, subject).encode("utf-8")).hexdigest()
+        return "{}ar:{}".format(self.key_prefix, digest[:32])
+
+    def store_access_request(self, host, subject, timestamp, payload):
+        key = self.key(host, subject)
+        expires = int((timestamp + self.ttl) * 1000)
+        # replace any previous request in one round trip and one transaction.
+        # Requests older than the ttl have expired, so they're dropped from
+        # the index, and the index expires with the newest request, IE when
+        # all of them have
+        self.client.pipeline([
+            ("MULTI",),
+            ("DEL", key),
+            ("HSET", key, "host", host, "subject", subject,
+             "timestamp", float(timestamp), "payload", payload),
+            ("PEXPIREAT", key, expires),
+            ("ZREMRANGEBYSCORE", self.index, "-inf", "({}".format(float(timestamp) - self.ttl)),
+            ("ZADD", self.index, float(timestamp), key),
+            ("PEXPIREAT", self.index, expires),
+            ("EXEC",),
+        ])
+
+    def get_access_request(self, host, subject):
+        values = self.client.execute("HMGET", self.key(host, subject), *FIELDS)
+        if values is None or values[0] is None:
+            return None
+        ar_host, ar_subject, timestamp, payload = [v.decode("utf-8") for v in values]
+        if ar_host != host or ar_subject != subject:
+            return None
+        return (ar_host, ar_subject, float(timestamp), payload)
+
+    def delete_access_requests(self, host, subject):
+        key = self.key(host, subject)
+        self.client.pipeline([("DEL", key), ("ZREM", self.index, key)])
+
+    def purge_expired(self, before_timestamp, batch_size=1000):
+        """
+        deletes the access requests older than before_timestamp that Redis
+        hasn't expired yet, and drops the expired ones from the index,
+        batch_size at a time
+
+        Arguments:
+        before_timestamp -- requests stored before this are deleted
+
+        Keyword Arguments:
+        batch_size -- number of requests deleted per transaction
+
+        Returns:
+        the number of access requests deleted
+        """
+        before = float(before_timestamp)
+        purged = 0
+        while True:
+            with self.client.connection() as request:
+                keys, = request([("ZRANGEBYSCORE", self.index, "-inf", "({}".format(before),
+                                  "LIMIT", 0, batch_size)])
+                if not keys:
+                    return purged
+                # a request stored again before the WATCH has a new timestamp,
+                # and one stored again after it aborts the transaction
+                replies = request([("WATCH",) + tuple(keys)] + [
+                    ("HGET", key, "timestamp") for key in keys])
+                expired = [key for key, timestamp in zip(keys, replies[1:])
+                           if timestamp is None or float(timestamp) < before]
+                if not expired:
+                    continue
+                replies = request([
+                    ("MULTI",),
+                    ("DEL",) + tuple(expired),
+                    ("ZREM", self.index) + tuple(expired),
+                    ("EXEC",),
+                ])
+                if replies[-1] is not None:
+                    purged += replies[-1][0]
@@ -1,17 +1,35 @@
+from contextlib import contextmanager
+import hashlib
+import threading
+import time
+
+from pyramid.settings import asbool
 from sqlalchemy import (
+    bindparam,
+    delete,
     engine_from_config,
+    event,
+    inspect,
+    select,
+    text,
+    update,
     Column,
+    Index,
     Integer,
     String,
     Float)
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.schema import CreateColumn
 
 from factored.plugins import IDataStorePlugin
 
+import logging
+logger = logging.getLogger("factored.plugins")
+
 
 Base = declarative_base()
-DBSession = scoped_session(sessionmaker())
 
 
 class AccessRequest(Base):
@@ -22,6 +40,15 @@ class AccessRequest(Base):
     subject = Column(String)
     timestamp = Column(Float)
     payload = Column(String)
+    # fixed width hash of (host, subject), see lookup_key
+    lookup_key = Column(String(32), nullable=True)
+
+    # only one of the unique indexes is kept, see KEY_INDEXES
+    __table_args__ = (
+        Index("ix_access_requests_host_subject", "host", "subject", unique=True),
+        Index("ix_access_requests_lookup_key", "lookup_key", unique=True),
+        Index("ix_access_requests_timestamp", "timestamp"),
+    )
 
     def __repr__(self):
         return "<AccessRequest [{}] ({}) {} {}>".format(
@@ -31,36 +58,321 @@ class AccessRequest(Base):
             self.timestamp)
 
 
+# the unique index access requests are looked up (and upserted) by, by
+# whether "hashed_keys" is enabled. The other one is dropped, so writes only
+# maintain one of them
+KEY_INDEXES = {
+    False: "ix_access_requests_host_subject",
+    True: "ix_access_requests_lookup_key",
+}
+
+
+# keeps the latest access request of each (host, subject), so a unique
+# index can be added to tables created before it existed. The derived table
+# is needed for MySQL, which can't select from the table it deletes from.
+DEDUPLICATE_ACCESS_REQUESTS = text("""
+    DELETE FROM access_requests WHERE id NOT IN (
+        SELECT id FROM (
+            SELECT MAX(id) AS id FROM access_requests GROUP BY host, subject
+        ) AS latest
+    )""")
+
+
+def lookup_key(host, subject):
+    """
+    Arguments:
+    host -- the host of the access request
+    subject -- the subject of the access request
+
+    Returns:
+    the 32 character hash of host and subject stored in the lookup_key column
+    """
+    return hashlib.sha256(
+        "{}\0{}".format(host, subject).encode("utf-8")).hexdigest()[:32]
+
+
+def migrate(engine, hashed_keys=False):
+    """
+    Brings the tables of databases created by older versions up to date, by
+    adding the columns and indexes they're missing, and makes the unique
+    index in KEY_INDEXES for hashed_keys the only one. This is idempotent,
+    and run every time SQLDataStore is initialized.
+
+    Arguments:
+    engine -- the engine of the database
+
+    Keyword Arguments:
+    hashed_keys -- whether access requests are looked up by lookup_key
+    """
+    table = AccessRequest.__table__
+    inspector = inspect(engine)
+    if not inspector.has_table(table.name):
+        return
+
+    existing = set(c["name"] for c in inspector.get_columns(table.name))
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        logger.info("adding column {} to {}".format(column.name, table.name))
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE {} ADD COLUMN {}".format(
+                table.name, CreateColumn(column).compile(dialect=engine.dialect))))
+
+    if hashed_keys:
+        fill_lookup_keys(engine)
+
+    existing = dict((ix["name"], ix) for ix in inspector.get_indexes(table.name))
+    for index in sorted(table.indexes, key=lambda ix: ix.name):
+        found = existing.get(index.name, None)
+        if index.name == KEY_INDEXES[not hashed_keys]:
+            if found is not None:
+                logger.info("dropping index {} from {}".format(index.name, table.name))
+                with engine.begin() as conn:
+                    index.drop(conn)
+            continue
+        if found is not None and bool(found["unique"]) == index.unique:
+            continue
+        logger.info("adding index {} to {}".format(index.name, table.name))
+        with engine.begin() as conn:
+            if found is not None:
+                index.drop(conn)
+            if index.unique:
+                conn.execute(DEDUPLICATE_ACCESS_REQUESTS)
+            index.create(conn)
+
+
+def fill_lookup_keys(engine, batch_size=1000):
+    """
+    Sets lookup_key for rows stored without one, IE before "hashed_keys" was
+    enabled
+
+    Arguments:
+    engine -- the engine of the database
+
+    Keyword Arguments:
+    batch_size -- number of rows updated per statement
+    """
+    table = AccessRequest.__table__
+    query = select(table.c.id, table.c.host, table.c.subject) \
+        .where(table.c.lookup_key.is_(None)) \
+        .limit(batch_size)
+    stmt = update(table) \
+        .where(table.c.id == bindparam("row_id")) \
+        .values(lookup_key=bindparam("row_key"))
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(query).fetchall()
+            if not rows:
+                return
+            conn.execute(stmt, [
+                {"row_id": row.id, "row_key": lookup_key(row.host, row.subject)}
+                for row in rows])
+
+
+def upsert_access_request(dialect, values, hashed_keys=False):
+    """
+    Arguments:
+    dialect -- name of the database dialect, IE "sqlite"
+    values -- dict of the AccessRequest columns to store
+
+    Keyword Arguments:
+    hashed_keys -- whether the unique index is on lookup_key rather than on
+                   host and subject, see KEY_INDEXES
+
+    Returns:
+    a statement that inserts the access request, or replaces the one with
+    the same host and subject, in one round trip. None if the dialect
+    doesn't support it.
+    """
+    table = AccessRequest.__table__
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(table).values(**values)
+        if hashed_keys:
+            index_elements = [table.c.lookup_key]
+        else:
+            index_elements = [table.c.host, table.c.subject]
+        return stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={
+                "timestamp": stmt.excluded.timestamp,
+                "payload": stmt.excluded.payload,
+                "lookup_key": stmt.excluded.lookup_key,
+            })
+    if dialect in ("mysql", "mariadb"):
+        stmt = mysql.insert(table).values(**values)
+        return stmt.on_duplicate_key_update(
+            timestamp=stmt.inserted.timestamp,
+            payload=stmt.inserted.payload,
+            lookup_key=stmt.inserted.lookup_key)
+    return None
+
+
+class PoolMetrics(object):
+    """
+    PoolMetrics counts the connections checked out of (and back in to) an
+    engine's pool, the connections the pool opened, and how long units of
+    work waited to get a connection.
+    """
+    def __init__(self, engine):
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+        event.listen(engine, "checkout", self._checkout)
+        event.listen(engine, "checkin", self._checkin)
+        event.listen(engine, "connect", self._connect)
+
+    def _checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def _checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+
+    def _connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def waited(self, seconds):
+        with self._lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def stats(self):
+        """
+        Returns:
+        dict of the checkouts, checkins, connections opened, connections
+        currently checked out, and the total and longest seconds waited for
+        a connection
+        """
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "checked_out": self.checkouts - self.checkins,
+                "wait_total": self.wait_total,
+                "wait_max": self.wait_max,
+            }
+
+
 class SQLDataStore(IDataStorePlugin):
+    """
+    Stores access requests with SQLAlchemy, configured by the "sql.*"
+    settings passed to engine_from_config, IE "sql.url", "sql.pool_size",
+    "sql.max_overflow", "sql.pool_timeout", "sql.pool_recycle" and
+    "sql.pool_pre_ping" (default true).
+
+    Every method is a unit of work with its own session from a
+    scoped_session, committed (or rolled back) and removed when it's done,
+    so threads never share a session.
+
+    Access requests are unique per (host, subject), and storing one is a
+    single upsert on SQLite, PostgreSQL and MySQL. Tables created by older
+    versions are migrated when the plugin is initialized.
+
+    If "hashed_keys" is "true", access requests are unique by, and looked
+    up by, a fixed width hash of (host, subject) rather than by the host and
+    subject themselves, which keeps the index small when subjects are long.
+    The unique index on (host, subject) is dropped then (and added back when
+    it's turned off), so every SQLDataStore using a database has to agree on
+    it.
+    """
     def initialize(self, settings):
-        self.dbengine = engine_from_config(settings, prefix="sql.")
-        DBSession.configure(bind=self.dbengine)
-        self.dbsession = DBSession()
+        config = dict(settings)
+        # engine_from_config doesn't coerce pool_pre_ping, and the string
+        # "false" would turn it on
+        config["sql.pool_pre_ping"] = asbool(config.get("sql.pool_pre_ping", True))
+        self.hashed_keys = asbool(config.pop("hashed_keys", False))
+        self.dbengine = engine_from_config(config, prefix="sql.")
+        self.metrics = PoolMetrics(self.dbengine)
+        self.sessions = scoped_session(sessionmaker(bind=self.dbengine))
 
-        # make sure tables are created
+        # make sure tables are created, and up to date
         Base.metadata.create_all(self.dbengine)
+        migrate(self.dbengine, hashed_keys=self.hashed_keys)
 
-    def store_access_request(self, host, subject, timestamp, payload):
-        self.delete_access_requests(host, subject)
+    def stats(self):
+        return self.metrics.stats()
+
+    @contextmanager
+    def session(self):
+        db = self.sessions()
+        try:
+            start = time.monotonic()
+            db.connection()
+            self.metrics.waited(time.monotonic() - start)
+            yield db
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            self.sessions.remove()
 
-        ar = AccessRequest()
-        ar.host = host
-        ar.subject = subject
-        ar.timestamp = timestamp
-        ar.payload = payload
+    def store_access_request(self, host, subject, timestamp, payload):
+        values = dict(host=host, subject=subject, timestamp=timestamp, payload=payload)
+        if self.hashed_keys:
+            values["lookup_key"] = lookup_key(host, subject)
+        stmt = upsert_access_request(self.dbengine.dialect.name, values, hashed_keys=self.hashed_keys)
+        with self.session() as db:
+            if stmt is not None:
+                db.execute(stmt)
+                return
+            self.filter_access_requests(db.query(AccessRequest), host, subject).delete()
+            db.add(AccessRequest(**values))
 
-        db = self.dbsession
-        db.add(ar)
-        db.commit()
+    def filter_access_requests(self, query, host, subject):
+        """
+        Returns:
+        query filtered to the access request of host and subject, by the
+        unique index that's kept
+        """
+        if self.hashed_keys:
+            query = query.filter_by(lookup_key=lookup_key(host, subject))
+        return query.filter_by(host=host, subject=subject)
 
     def get_access_request(self, host, subject):
-        db = self.dbsession
-        ar = db.query(AccessRequest).filter_by(host=host, subject=subject).first()
-        if ar is None:
-            return None
-        return (ar.host, ar.subject, ar.timestamp, ar.payload)
+        query = (AccessRequest.host, AccessRequest.subject, AccessRequest.timestamp, AccessRequest.payload)
+        with self.session() as db:
+            ar = self.filter_access_requests(db.query(*query), host, subject).first()
+            if ar is None:
+                return None
+            return (ar.host, ar.subject, ar.timestamp, ar.payload)
+
+    def purge_expired(self, before_timestamp, batch_size=1000):
+        """
+        deletes access requests stored before before_timestamp, batch_size
+        at a time (using the timestamp index) so the table isn't locked for
+        long
+
+        Arguments:
+        before_timestamp -- requests stored before this are deleted
+
+        Keyword Arguments:
+        batch_size -- number of requests deleted per transaction
+
+        Returns:
+        the number of access requests deleted
+        """
+        table = AccessRequest.__table__
+        query = select(table.c.id) \
+            .where(table.c.timestamp < before_timestamp) \
+            .limit(batch_size)
+        purged = 0
+        while True:
+            with self.session() as db:
+                ids = db.execute(query).scalars().all()
+                if ids:
+                    db.execute(delete(table).where(table.c.id.in_(ids)))
+            purged += len(ids)
+            if len(ids) < batch_size:
+                return purged
 
     def delete_access_requests(self, host, subject):
-        db = self.dbsession
-        db.query(AccessRequest).filter_by(host=host, subject=subject).delete()
-        db.commit()
+        with self.session() as db:
+            self.filter_access_requests(db.query(AccessRequest), host, subject).delete()
@@ -0,0 +1,43 @@
+from factored.kvstore import KVStoreClient
+from factored.plugins import IDataStorePlugin
+
+import logging
+logger = logging.getLogger("factored.plugins")
+
+
+class SocketDataStore(IDataStorePlugin):
+    """
+    Stores access requests in a factored_kvstore daemon (see factored.kvstore)
+    listening on the Unix socket at "socket", so every authenticator process
+    on the host shares them at memory speed. Up to "pool_size" (default 4)
+    connections are kept open, and the daemon is waited on for at most
+    "timeout" seconds (default 5).
+    """
+    def initialize(self, settings):
+        path = settings.get("socket", "/run/factored/kvstore.sock")
+        try:
+            pool_size = int(settings.get("pool_size", 4))
+            timeout = float(settings.get("timeout", 5))
+        except Exception:
+            logger.error("failed to get SocketDataStore config", exc_info=True)
+            pool_size = 4
+            timeout = 5
+        self.client = KVStoreClient(path, pool_size=pool_size, timeout=timeout)
+
+    def store_access_request(self, host, subject, timestamp, payload):
+        self.client.call("set", host, subject, timestamp, payload)
+
+    def get_access_request(self, host, subject):
+        ar = self.client.call("get", host, subject)
+        if ar is None:
+            return None
+        return tuple(ar)
+
+    def delete_access_requests(self, host, subject):
+        self.client.call("delete", host, subject)
+
+    def purge_expired(self, before_timestamp):
+        return self.client.call("purge", before_timestamp)
+
+    def stats(self):
+        return self.client.call("stats")
@@ -6,28 +6,104 @@ import logging
 logger = logging.getLogger("factored.plugins")
 
 
+# might not correctly get _all_ addresses, but should succeed on most
+# of the ones we're looking for. If more accuracy is needed, you might
+# want to create a more sophisticated plugin.
+EMAIL_RE = re.compile(r"^[a-zA-Z0-9_.+-]+@([a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+)$")
+
+# marks a node in the suffix trie whose subdomains are all valid
+SUBDOMAINS = None
+
+
+def build_suffix_trie(domains):
+    """
+    Arguments:
+    domains -- iterable of domains whose subdomains should all match
+
+    Returns:
+    a trie of nested dicts keyed by domain label, starting from the top level
+    domain, IE "example.com" is stored as {"com": {"example": {SUBDOMAINS: True}}}
+    """
+    trie = {}
+    for domain in domains:
+        node = trie
+        for label in reversed(domain.split(".")):
+            node = node.setdefault(label, {})
+        node[SUBDOMAINS] = True
+    return trie
+
+
+def match_subdomain(trie, domain):
+    """
+    Arguments:
+    trie -- a trie created by build_suffix_trie
+    domain -- the normalized domain to check
+
+    Returns:
+    True if domain is a subdomain of one of the domains in the trie, the cost
+    is the number of labels in domain no matter how big the trie is
+    """
+    labels = domain.split(".")
+    node = trie
+    # stop before the leftmost label, a domain isn't a subdomain of itself
+    for i in range(len(labels) - 1, 0, -1):
+        node = node.get(labels[i], None)
+        if node is None:
+            return False
+        if SUBDOMAINS in node:
+            return True
+    return False
+
+
 class EMailDomain(IFinderPlugin):
+    """
+    Finds subjects that are email addresses in one of the configured
+    "valid_domains", one per line. Entries can be:
+
+      - an exact domain, IE "example.com"
+      - a wildcard, IE "*.example.com", which matches any subdomain of
+        example.com (but not example.com itself)
+
+    If "include_subdomains" is "true", exact domains also match their
+    subdomains.
+    """
     def initialize(self, settings):
         self.settings = settings
 
+        # normalize the configured domains once, rather than on every check
+        valid_domains = settings.get("valid_domains", None)
+        if valid_domains is None:
+            self.valid_domains = None
+            self.valid_suffixes = {}
+            return
+
+        include_subdomains = settings.get("include_subdomains", "false").strip().lower() == "true"
+        exact = set()
+        suffixes = set()
+        for d in valid_domains.splitlines():
+            d = d.strip().lower()
+            if not d:
+                continue
+            if d.startswith("*."):
+                suffixes.add(d[2:])
+            else:
+                exact.add(d)
+                if include_subdomains:
+                    suffixes.add(d)
+        self.valid_domains = frozenset(exact)
+        self.valid_suffixes = build_suffix_trie(suffixes)
+
     def is_valid_subject(self, host, sub):
-        # might not correctly get _all_ addresses, but should succeed on most
-        # of the ones we're looking for. If more accuracy is needed, you might
-        # want to create a more sophisticated plugin.
-        m = re.search("^[a-zA-Z0-9_.+-]+@([a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+)$", sub)
+        m = EMAIL_RE.match(sub)
         if m is None:
             return False
 
         domainpart = m.group(1).strip().lower()
 
-        valid_domains = self.settings.get("valid_domains", None)
-        if valid_domains is None:
+        if self.valid_domains is None:
             logger.error("valid_domains not configured for emaildomain plugin")
             return False
-        valid_domains = valid_domains.splitlines()
-
-        for d in valid_domains:
-            if d.strip().lower() == domainpart:
-                return True
 
-        return False
+        if domainpart in self.valid_domains:
+            return True
+        return match_subdomain(self.valid_suffixes, domainpart)
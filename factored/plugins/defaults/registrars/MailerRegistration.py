@@ -1,7 +1,6 @@
-from pyramid_mailer.mailer import Mailer
 from pyramid_mailer.message import Message
 
-from factored.mail import create_message_id
+from factored.mail import create_message_id, get_mailer
 from factored.plugins import IRegistrationPlugin
 
 
@@ -47,7 +46,7 @@ class MailerRegistration(IRegistrationPlugin):
                 extra_headers={
                     "Message-ID": create_message_id(domain=msgdomain),
                 })
-            mailer = Mailer.from_settings(settings)
+            mailer = get_mailer(settings)
             try:
                 mailer.send_immediately(message, fail_silently=False)
                 auditlog.info("sent registration request ({fname} {lname} {email}) "
@@ -1,4 +1,6 @@
 import os
+import socketserver
+import threading
 import unittest
 
 from pyramid import testing
@@ -21,12 +23,745 @@ class PluginTests(unittest.TestCase):
         self.assertIsNone(manager.getPluginByName("EMailAuth"))
         self.assertIsNotNone(manager.getPluginByName("MemDataStore", category="datastore"))
         self.assertIsNotNone(manager.getPluginByName("SQLDataStore", category="datastore"))
+        self.assertIsNotNone(manager.getPluginByName("SocketDataStore", category="datastore"))
+        self.assertIsNotNone(manager.getPluginByName("RedisDataStore", category="datastore"))
         self.assertIsNotNone(manager.getPluginByName("EMailDomain", category="finder"))
         self.assertIsNotNone(manager.getPluginByName("MailerRegistration", category="registrar"))
         self.assertIsNotNone(manager.getPluginByName("DefaultSettings", category="settings"))
         self.assertIsNotNone(manager.getPluginByName("DefaultTemplate", category="template"))
 
 
+class CachedFinderTests(unittest.TestCase):
+    def test_is_valid_subject_cached(self):
+        from factored.plugins import CachedFinder, IFinderPlugin
+
+        class CountingFinder(IFinderPlugin):
+            calls = 0
+
+            def is_valid_subject(self, host, sub):
+                self.calls += 1
+                return sub.endswith("@example.com")
+
+        finder = CountingFinder()
+        cached = CachedFinder(finder, positive_ttl=60, negative_ttl=0)
+        self.assertTrue(cached.is_valid_subject("a", "test@example.com"))
+        self.assertTrue(cached.is_valid_subject("a", "test@example.com"))
+        self.assertEqual(finder.calls, 1)
+
+        # per host
+        self.assertTrue(cached.is_valid_subject("b", "test@example.com"))
+        self.assertEqual(finder.calls, 2)
+
+        # negative answers aren't cached with a negative_ttl of 0
+        self.assertFalse(cached.is_valid_subject("a", "test@example.org"))
+        self.assertFalse(cached.is_valid_subject("a", "test@example.org"))
+        self.assertEqual(finder.calls, 4)
+        self.assertEqual(cached.stats()["hits"], 1)
+
+
+class EMailDomainPluginTests(unittest.TestCase):
+    def setUp(self):
+        from factored.plugins import get_manager
+
+        self.finder = get_manager().getPluginByName("EMailDomain", category="finder").plugin_object
+
+    def test_is_valid_subject(self):
+        self.finder.initialize({"valid_domains": "wildcardcorp.com\n   Assemblys.NET  \n\n"})
+        self.assertTrue(self.finder.is_valid_subject("host", "test@wildcardcorp.com"))
+        self.assertTrue(self.finder.is_valid_subject("host", "test@ASSEMBLYS.net"))
+        self.assertFalse(self.finder.is_valid_subject("host", "test@example.com"))
+        self.assertFalse(self.finder.is_valid_subject("host", "not an email"))
+
+    def test_subdomains(self):
+        self.finder.initialize({"valid_domains": "*.example.com\nwildcardcorp.com"})
+        self.assertTrue(self.finder.is_valid_subject("host", "test@mail.example.com"))
+        self.assertTrue(self.finder.is_valid_subject("host", "test@a.b.example.com"))
+        self.assertFalse(self.finder.is_valid_subject("host", "test@example.com"))
+        self.assertFalse(self.finder.is_valid_subject("host", "test@badexample.com"))
+        self.assertFalse(self.finder.is_valid_subject("host", "test@mail.wildcardcorp.com"))
+
+        self.finder.initialize({
+            "valid_domains": "wildcardcorp.com",
+            "include_subdomains": "true",
+        })
+        self.assertTrue(self.finder.is_valid_subject("host", "test@wildcardcorp.com"))
+        self.assertTrue(self.finder.is_valid_subject("host", "test@mail.wildcardcorp.com"))
+
+    def test_not_configured(self):
+        self.finder.initialize({})
+        self.assertFalse(self.finder.is_valid_subject("host", "test@wildcardcorp.com"))
+
+
+class EMailAuthCodeHashTests(unittest.TestCase):
+    def setUp(self):
+        from factored.plugins import get_manager
+
+        self.auth = get_manager().getPluginByName("EMailAuth", category="authenticator").plugin_object
+
+    def test_schemes(self):
+        for settings in [
+                {"code_hash.scheme": "pbkdf2", "code_hash.iterations": "1000"},
+                {"code_hash.scheme": "scrypt", "code_hash.scrypt_n": "1024"},
+                {"code_hash.scheme": "hmac", "code_hash.secret": "deploymentsecret"}]:
+            payload = self.auth.get_code_hash(settings, "abc123")
+            self.assertTrue(payload.startswith(settings["code_hash.scheme"] + "$"))
+            self.assertTrue(self.auth.check_code_hash(settings, "abc123", payload))
+            self.assertFalse(self.auth.check_code_hash(settings, "abc124", payload))
+
+        # hmac without a secret falls back to pbkdf2
+        self.assertTrue(self.auth.get_code_hash({"code_hash.scheme": "hmac"}, "abc123").startswith("pbkdf2$100000$"))
+
+        # so do an unknown digest and scrypt params hashlib refuses
+        for settings in [
+                {"code_hash.scheme": "hmac", "code_hash.secret": "deploymentsecret", "code_hash.digest": "sha265"},
+                {"code_hash.scheme": "scrypt", "code_hash.scrypt_n": "1000"}]:
+            self.assertEqual(self.auth.code_hash_scheme(settings), ("pbkdf2", "100000"))
+            self.assertTrue(self.auth.get_code_hash(settings, "abc123").startswith("pbkdf2$100000$"))
+
+    def test_scheme_change(self):
+        payload = self.auth.get_code_hash({"code_hash.iterations": "1000"}, "abc123")
+        settings = {"code_hash.scheme": "hmac", "code_hash.secret": "deploymentsecret"}
+        self.assertTrue(self.auth.check_code_hash(settings, "abc123", payload))
+
+        # plain hex hashes from before schemes were stored
+        legacy = self.auth.get_code_hash({}, "abc123").split("$")[2]
+        self.assertTrue(self.auth.check_code_hash(settings, "abc123", legacy))
+        self.assertFalse(self.auth.check_code_hash(settings, "abc124", legacy))
+
+
+class MemDataStoreTests(unittest.TestCase):
+    def setUp(self):
+        from factored.plugins import get_manager
+
+        self.now = 1000.0
+        self.ds = get_manager().getPluginByName("MemDataStore", category="datastore").plugin_object
+        self.ds.initialize({"max_entries": "3", "ttl": "60"})
+        self.ds.clock = lambda: self.now
+
+    def test_access_requests(self):
+        ds = self.ds
+        ds.store_access_request("a", "bc", 1000.0, "first")
+        self.assertIsNone(ds.get_access_request("ab", "c"))
+        ds.store_access_request("a", "bc", 1001.0, "second")
+        self.assertEqual(ds.get_access_request("a", "bc"), ("a", "bc", 1001.0, "second"))
+        ds.delete_access_requests("a", "bc")
+        self.assertIsNone(ds.get_access_request("a", "bc"))
+
+    def test_expiry(self):
+        ds = self.ds
+        ds.store_access_request("host", "old@example.com", 1000.0, "code")
+        ds.store_access_request("host", "new@example.com", 1030.0, "code")
+        ds.store_access_request("host", "stale@example.com", 900.0, "code")
+        self.assertIsNone(ds.get_access_request("host", "stale@example.com"))
+        self.now = 1065.0
+        self.assertIsNone(ds.get_access_request("host", "old@example.com"))
+        self.assertIsNotNone(ds.get_access_request("host", "new@example.com"))
+        self.assertEqual(len(ds.data), 1)
+        # a long time later, the wheel has gone all the way around
+        self.now = 5000.0
+        self.assertIsNone(ds.get_access_request("host", "new@example.com"))
+        stats = ds.stats()
+        self.assertEqual(stats["entries"], 0)
+        self.assertEqual(stats["expired"], 3)
+
+    def test_lru(self):
+        ds = self.ds
+        for i in range(3):
+            ds.store_access_request("host", "user{}@example.com".format(i), 1000.0, "code")
+        self.assertIsNotNone(ds.get_access_request("host", "user0@example.com"))
+        ds.store_access_request("host", "user3@example.com", 1000.0, "code")
+        self.assertIsNone(ds.get_access_request("host", "user1@example.com"))
+        self.assertIsNotNone(ds.get_access_request("host", "user0@example.com"))
+        stats = ds.stats()
+        self.assertEqual(stats["entries"], 3)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertGreater(stats["memory"], 0)
+
+    def test_purge_expired(self):
+        ds = self.ds
+        ds.store_access_request("host", "old@example.com", 1000.0, "old")
+        ds.store_access_request("host", "renewed@example.com", 1001.0, "first")
+        ds.store_access_request("host", "renewed@example.com", 1020.0, "second")
+        self.now = 1030.0
+        ds.store_access_request("host", "new@example.com", 1030.0, "new")
+        self.assertEqual(ds.purge_expired(1010.0), 1)
+        self.assertIsNone(ds.get_access_request("host", "old@example.com"))
+        self.assertIsNotNone(ds.get_access_request("host", "renewed@example.com"))
+        self.assertEqual(ds.purge_expired(1010.0), 0)
+        self.assertEqual(ds.purge_expired(1025.0), 1)
+        self.assertIsNotNone(ds.get_access_request("host", "new@example.com"))
+        self.assertEqual(ds.purge_expired(2000.0), 1)
+        self.assertEqual(len(ds.data), 0)
+
+
+class SocketDataStoreTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        import threading
+        from factored.kvstore import KVStoreServer
+        from factored.plugins import get_manager
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "kvstore.sock")
+        self.server = KVStoreServer(self.path, settings={"ttl": "60"})
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.ds = get_manager().getPluginByName("SocketDataStore", category="datastore").plugin_object
+        self.ds.initialize({"socket": self.path, "pool_size": "2"})
+
+    def tearDown(self):
+        self.ds.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def test_access_requests(self):
+        import time
+        from factored.kvstore import KVStoreClient, KVStoreError
+
+        now = time.time()
+        self.ds.store_access_request("host", "test@example.com", now, "code")
+        self.assertEqual(
+            self.ds.get_access_request("host", "test@example.com"),
+            ("host", "test@example.com", now, "code"))
+
+        # other processes see the same requests
+        other = KVStoreClient(self.path)
+        self.assertEqual(other.call("get", "host", "test@example.com")[3], "code")
+        self.assertRaises(KVStoreError, other.call, "missing")
+        other.close()
+
+        self.ds.delete_access_requests("host", "test@example.com")
+        self.assertIsNone(self.ds.get_access_request("host", "test@example.com"))
+        self.ds.store_access_request("host", "old@example.com", now - 30, "code")
+        self.assertEqual(self.ds.purge_expired(now - 10), 1)
+        self.assertEqual(self.ds.stats()["entries"], 0)
+
+    def test_server_socket(self):
+        import socket
+        import stat
+        from factored.kvstore import KVStoreError, KVStoreServer
+
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+        # a live daemon's socket isn't taken over
+        self.assertRaises(KVStoreError, KVStoreServer, self.path)
+        self.assertIsNone(self.ds.get_access_request("host", "test@example.com"))
+
+        # a socket left behind by a daemon that's gone is replaced
+        path = os.path.join(self.tmpdir.name, "stale.sock")
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        server = KVStoreServer(path)
+        server.server_close()
+
+        # the socket is private from the moment it's bound, and the umask is
+        # restored afterwards
+        modes = []
+        chmod = os.chmod
+
+        def recording_chmod(path, mode):
+            modes.append(stat.S_IMODE(os.stat(path).st_mode))
+            chmod(path, mode)
+
+        umask = os.umask(0o022)
+        os.chmod = recording_chmod
+        try:
+            server = KVStoreServer(path, mode=0o660)
+            self.assertEqual(os.umask(0o022), 0o022)
+        finally:
+            os.chmod = chmod
+            os.umask(umask)
+        self.assertEqual(modes, [0o600])
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o660)
+        server.server_close()
+
+    def test_timeout_not_retried(self):
+        import socket
+        from factored.kvstore import KVStoreClient
+
+        path = os.path.join(self.tmpdir.name, "slow.sock")
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(5)
+        received = []
+        done = threading.Event()
+
+        def serve():
+            conn, _ = listener.accept()
+            rfile = conn.makefile("rb")
+            # answers the first command, then stops answering
+            received.append(rfile.readline())
+            conn.sendall(b'["ok", null]\n')
+            received.append(rfile.readline())
+            done.wait(5)
+            conn.close()
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        client = KVStoreClient(path, timeout=0.2)
+        try:
+            self.assertIsNone(client.call("delete", "host", "test@example.com"))
+            self.assertRaises(socket.timeout, client.call, "delete", "host", "test@example.com")
+            thread.join(1)
+            self.assertEqual(len(received), 2)
+            listener.settimeout(0.1)
+            # no second connection was made to send the command again
+            self.assertRaises(socket.timeout, listener.accept)
+        finally:
+            done.set()
+            client.close()
+            listener.close()
+
+    def test_reconnect(self):
+        import socket
+
+        self.assertIsNone(self.ds.get_access_request("host", "test@example.com"))
+        self.assertEqual(len(self.ds.client._idle), 1)
+        # the pooled connection was dropped, IE the daemon was restarted
+        sock, _ = self.ds.client._idle[0]
+        sock.shutdown(socket.SHUT_RDWR)
+        self.assertIsNone(self.ds.get_access_request("host", "test@example.com"))
+        self.assertEqual(len(self.ds.client._idle), 1)
+        self.assertIsNot(self.ds.client._idle[0][0], sock)
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        queued = None
+        watched = {}
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            name = args[0].decode().upper()
+            if name == "MULTI":
+                queued = []
+                reply = "OK"
+            elif name == "WATCH":
+                with self.server.lock:
+                    watched.update((k, self.server.versions.get(k, 0)) for k in args[1:])
+                reply = "OK"
+            elif name == "UNWATCH":
+                watched = {}
+                reply = "OK"
+            elif name == "EXEC":
+                with self.server.lock:
+                    if any(self.server.versions.get(k, 0) != v for k, v in watched.items()):
+                        reply = None
+                    else:
+                        reply = [self.server.run(c[0].decode().upper(), c[1:]) for c in queued]
+                queued = None
+                watched = {}
+            elif queued is not None:
+                queued.append(args)
+                reply = "QUEUED"
+            else:
+                with self.server.lock:
+                    reply = self.server.run(name, args[1:])
+            self.wfile.write(self.encode(reply))
+
+    def encode(self, reply):
+        from factored.resp import RESPError
+
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, RESPError):
+            return "-{}\r\n".format(reply).encode()
+        if isinstance(reply, str):
+            return "+{}\r\n".format(reply).encode()
+        if isinstance(reply, int):
+            return ":{}\r\n".format(reply).encode()
+        if isinstance(reply, bytes):
+            return b"$" + str(len(reply)).encode() + b"\r\n" + reply + b"\r\n"
+        return b"*" + str(len(reply)).encode() + b"\r\n" + b"".join(self.encode(r) for r in reply)
+
+
+class FakeRedisServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    just enough of a Redis server for RedisDataStore, with expiry by the
+    clock of the test
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        socketserver.TCPServer.__init__(self, ("127.0.0.1", 0), FakeRedisHandler)
+        self.lock = threading.Lock()
+        self.data = {}
+        self.expires = {}
+        self.versions = {}
+        self.now = 1000.0
+
+    def live(self, key):
+        if key in self.expires and self.expires[key] <= self.now * 1000:
+            self.data.pop(key, None)
+            self.expires.pop(key)
+        return self.data.get(key, None)
+
+    def score_range(self, zset, lo, hi):
+        hi = float(hi[1:]) if hi.startswith(b"(") else float(hi)
+        return sorted((s, m) for m, s in zset.items() if s < hi)
+
+    def run(self, name, args):
+        from factored.resp import RESPError
+
+        if name in ("DEL", "HSET", "PEXPIREAT", "ZADD", "ZREM", "ZREMRANGEBYSCORE"):
+            for key in args[:1] if name != "DEL" else args:
+                self.versions[key] = self.versions.get(key, 0) + 1
+        if name in ("PING", "AUTH", "SELECT"):
+            return "OK"
+        if name == "DEL":
+            found = [k for k in args if self.live(k) is not None]
+            for k in found:
+                del self.data[k]
+                self.expires.pop(k, None)
+            return len(found)
+        if name == "HSET":
+            h = self.live(args[0])
+            if h is None:
+                h = self.data[args[0]] = {}
+            h.update(zip(args[1::2], args[2::2]))
+            return len(args[1:]) // 2
+        if name == "HGET":
+            return (self.live(args[0]) or {}).get(args[1], None)
+        if name == "HMGET":
+            h = self.live(args[0]) or {}
+            return [h.get(f, None) for f in args[1:]]
+        if name == "PEXPIREAT":
+            self.expires[args[0]] = int(args[1])
+            return 1
+        if name == "ZADD":
+            self.live(args[0])
+            z = self.data.setdefault(args[0], {})
+            z[args[2]] = float(args[1])
+            return 1
+        if name == "ZREM":
+            z = self.live(args[0]) or {}
+            return len([z.pop(m) for m in args[1:] if m in z])
+        if name == "ZRANGEBYSCORE":
+            found = [m for s, m in self.score_range(self.live(args[0]) or {}, args[1], args[2])]
+            if len(args) == 6:
+                found = found[int(args[4]):int(args[4]) + int(args[5])]
+            return found
+        if name == "ZCARD":
+            return len(self.live(args[0]) or {})
+        if name == "ZREMRANGEBYSCORE":
+            z = self.live(args[0]) or {}
+            found = self.score_range(z, args[1], args[2])
+            for s, m in found:
+                del z[m]
+            return len(found)
+        return RESPError("ERR unknown command '{}'".format(name))
+
+
+class RedisDataStoreTests(unittest.TestCase):
+    def setUp(self):
+        from factored.plugins import get_manager
+
+        self.server = FakeRedisServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.ds = get_manager().getPluginByName("RedisDataStore", category="datastore").plugin_object
+        self.ds.initialize({
+            "host": "127.0.0.1",
+            "port": str(self.server.server_address[1]),
+            "password": "secret",
+            "ttl": "60",
+        })
+
+    def tearDown(self):
+        self.ds.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_access_requests(self):
+        ds = self.ds
+        ds.store_access_request("a", "bc", 1000.0, "first")
+        ds.store_access_request("a", "bc", 1001.5, "second")
+        self.assertEqual(ds.get_access_request("a", "bc"), ("a", "bc", 1001.5, "second"))
+        self.assertIsNone(ds.get_access_request("ab", "c"))
+        ds.delete_access_requests("a", "bc")
+        self.assertIsNone(ds.get_access_request("a", "bc"))
+        self.assertEqual(ds.client.connects, 1)
+
+    def test_pipelining(self):
+        requests = []
+        request = self.ds.client._request
+
+        def counting_request(conn, commands):
+            requests.append(commands)
+            return request(conn, commands)
+
+        self.ds.client._request = counting_request
+        self.ds.store_access_request("host", "test@example.com", 1000.0, "code")
+        # auth and the whole store are one round trip each
+        self.assertEqual(len(requests), 2)
+        self.assertEqual([c[0] for c in requests[1]], [
+            "MULTI", "DEL", "HSET", "PEXPIREAT", "ZREMRANGEBYSCORE", "ZADD", "PEXPIREAT", "EXEC"])
+
+    def test_expiry(self):
+        ds = self.ds
+        ds.store_access_request("host", "old@example.com", 1000.0, "code")
+        ds.store_access_request("host", "new@example.com", 1030.0, "code")
+        self.server.now = 1065.0
+        self.assertIsNone(ds.get_access_request("host", "old@example.com"))
+        self.assertIsNotNone(ds.get_access_request("host", "new@example.com"))
+        self.assertEqual(ds.purge_expired(1040.0), 1)
+        self.assertIsNone(ds.get_access_request("host", "new@example.com"))
+        self.assertEqual(self.server.data[ds.index.encode()], {})
+
+    def test_index_bounded(self):
+        ds = self.ds
+        for i in range(100):
+            self.server.now = 1000.0 + i * 10
+            ds.store_access_request("host", "user{}@example.com".format(i), self.server.now, "code")
+        # only the requests of the last ttl (60 seconds) are left in the index
+        self.assertEqual(ds.client.execute("ZCARD", ds.index), 7)
+        self.assertEqual(self.server.expires[ds.index.encode()], (1990 + 60) * 1000)
+        self.server.now = 2050.0
+        self.assertEqual(ds.client.execute("ZCARD", ds.index), 0)
+
+    def test_purge_batches(self):
+        ds = self.ds
+        for i in range(5):
+            ds.store_access_request("host", "user{}@example.com".format(i), 1000.0 + i, "code")
+        self.assertEqual(ds.purge_expired(1010.0, batch_size=2), 5)
+        self.assertEqual(self.server.data[ds.index.encode()], {})
+
+    def test_purge_restored(self):
+        ds = self.ds
+        ds.store_access_request("host", "a@example.com", 1000.0, "old")
+        ds.store_access_request("host", "b@example.com", 1000.0, "old")
+        request = ds.client._request
+        hooked = set()
+
+        def storing_request(conn, commands):
+            # each request is stored again while it's being purged, a before
+            # its key is watched and b after
+            name = commands[0][0]
+            if name == "WATCH" and "a" not in hooked:
+                hooked.add("a")
+                ds.store_access_request("host", "a@example.com", 1050.0, "new")
+            elif name == "MULTI" and commands[1][0] == "DEL" and "b" not in hooked:
+                hooked.add("b")
+                ds.store_access_request("host", "b@example.com", 1050.0, "new")
+            return request(conn, commands)
+
+        ds.client._request = storing_request
+        self.assertEqual(ds.purge_expired(1010.0), 0)
+        ds.client._request = request
+        self.assertEqual(hooked, set(["a", "b"]))
+        self.assertEqual(ds.get_access_request("host", "a@example.com")[3], "new")
+        self.assertEqual(ds.get_access_request("host", "b@example.com")[3], "new")
+
+    def test_transaction_errors(self):
+        from factored.resp import RESPError
+
+        self.server.data[self.ds.index.encode()] = "not a sorted set"
+        self.server.run = lambda name, args, run=self.server.run: \
+            RESPError("WRONGTYPE wrong kind of value") if name.startswith("Z") else run(name, args)
+        self.assertRaises(RESPError, self.ds.store_access_request,
+                          "host", "test@example.com", 1000.0, "code")
+
+
+class AsyncDataStoreTests(unittest.TestCase):
+    def setUp(self):
+        import asyncio
+
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_thread_pool(self):
+        import asyncio
+        import time
+        from factored.plugins import get_manager, IAsyncDataStore
+
+        ds = get_manager().getPluginByName("MemDataStore", category="datastore").plugin_object
+        ds.initialize({})
+        ads = ds.get_async({"executor.workers": "2"})
+        self.assertIsInstance(ads, IAsyncDataStore)
+
+        async def requests():
+            now = time.time()
+            await asyncio.gather(*[
+                ads.store_access_request("host", "user{}@example.com".format(i), now, "code")
+                for i in range(20)])
+            found = await asyncio.gather(*[
+                ads.get_access_request("host", "user{}@example.com".format(i))
+                for i in range(20)])
+            await ads.delete_access_requests("host", "user0@example.com")
+            return found, await ads.get_access_request("host", "user0@example.com")
+
+        found, deleted = self.loop.run_until_complete(requests())
+        self.assertEqual([ar[1] for ar in found], ["user{}@example.com".format(i) for i in range(20)])
+        self.assertIsNone(deleted)
+
+    def test_busy(self):
+        import asyncio
+        from factored.plugins import ExecutorBusy, IDataStorePlugin, PluginExecutor, ThreadPoolDataStore
+
+        release = threading.Event()
+
+        class SlowDataStore(IDataStorePlugin):
+            def get_access_request(self, host, subject):
+                release.wait(5)
+
+        executor = PluginExecutor(workers=1, max_pending=1, timeout=0.1)
+        ads = ThreadPoolDataStore(SlowDataStore(), executor)
+
+        async def requests():
+            first = asyncio.ensure_future(ads.get_access_request("host", "a"))
+            await asyncio.sleep(0)
+            with self.assertRaises(ExecutorBusy):
+                await ads.get_access_request("host", "b")
+            with self.assertRaises(ExecutorBusy):
+                await first
+
+        try:
+            self.loop.run_until_complete(requests())
+        finally:
+            release.set()
+            executor.shutdown()
+        self.assertEqual(executor.stats()["rejected"], 1)
+        self.assertEqual(executor.stats()["timeouts"], 1)
+
+
+class SQLDataStoreTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from factored.plugins import get_manager
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.ds = get_manager().getPluginByName("SQLDataStore", category="datastore").plugin_object
+        self.ds.initialize({
+            "sql.url": "sqlite:///{}/db.sqlite".format(self.tmpdir.name),
+            "sql.pool_size": "2",
+            "sql.max_overflow": "2",
+        })
+
+    def tearDown(self):
+        self.ds.dbengine.dispose()
+        self.tmpdir.cleanup()
+
+    def test_access_requests(self):
+        self.ds.store_access_request("host", "test@example.com", 1.0, "first")
+        self.ds.store_access_request("host", "test@example.com", 2.0, "second")
+        self.assertEqual(
+            self.ds.get_access_request("host", "test@example.com"),
+            ("host", "test@example.com", 2.0, "second"))
+        self.assertIsNone(self.ds.get_access_request("otherhost", "test@example.com"))
+        self.ds.delete_access_requests("host", "test@example.com")
+        self.assertIsNone(self.ds.get_access_request("host", "test@example.com"))
+
+    def test_purge_expired(self):
+        for i in range(10):
+            self.ds.store_access_request("host", "user{}@example.com".format(i), float(i), "code")
+        self.assertEqual(self.ds.purge_expired(7.0, batch_size=3), 7)
+        self.assertIsNone(self.ds.get_access_request("host", "user6@example.com"))
+        self.assertIsNotNone(self.ds.get_access_request("host", "user7@example.com"))
+        self.assertEqual(self.ds.purge_expired(7.0), 0)
+
+    def test_pool_pre_ping(self):
+        self.assertIs(self.ds.dbengine.pool._pre_ping, True)
+        self.ds.dbengine.dispose()
+        self.ds.initialize({
+            "sql.url": "sqlite:///{}/db.sqlite".format(self.tmpdir.name),
+            "sql.pool_pre_ping": "false",
+        })
+        self.assertIs(self.ds.dbengine.pool._pre_ping, False)
+
+    def test_upsert_statements(self):
+        from sqlalchemy.dialects import mysql, postgresql, sqlite
+        from factored.plugins.defaults.datastores.SQLDataStore import upsert_access_request
+
+        values = dict(host="host", subject="test@example.com", timestamp=1.0, payload="code")
+        stmt = upsert_access_request("postgresql", values)
+        self.assertIn("ON CONFLICT (host, subject) DO UPDATE", str(stmt.compile(dialect=postgresql.dialect())))
+        stmt = upsert_access_request("sqlite", dict(values, lookup_key="key"), hashed_keys=True)
+        self.assertIn("ON CONFLICT (lookup_key) DO UPDATE", str(stmt.compile(dialect=sqlite.dialect())))
+        stmt = upsert_access_request("mysql", values)
+        self.assertIn("ON DUPLICATE KEY UPDATE", str(stmt.compile(dialect=mysql.dialect())))
+        self.assertIsNone(upsert_access_request("oracle", values))
+
+    def test_migrate(self):
+        import sqlite3
+        import sqlalchemy
+
+        # a table from before the unique index, with a duplicate request
+        path = "{}/old.sqlite".format(self.tmpdir.name)
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE access_requests (id INTEGER PRIMARY KEY, "
+                     "host VARCHAR, subject VARCHAR, timestamp FLOAT, payload VARCHAR)")
+        conn.executemany("INSERT INTO access_requests (host, subject, timestamp, payload) VALUES (?, ?, ?, ?)", [
+            ("host", "test@example.com", 1.0, "old"),
+            ("host", "test@example.com", 2.0, "new"),
+        ])
+        conn.commit()
+        conn.close()
+
+        self.ds.dbengine.dispose()
+        self.ds.initialize({"sql.url": "sqlite:///" + path, "hashed_keys": "true"})
+        self.assertEqual(self.ds.get_access_request("host", "test@example.com")[3], "new")
+        self.ds.store_access_request("host", "test@example.com", 3.0, "newer")
+        self.assertEqual(self.ds.get_access_request("host", "test@example.com")[3], "newer")
+        with self.ds.session() as db:
+            self.assertEqual(db.execute(sqlalchemy.text(
+                "SELECT COUNT(*) FROM access_requests WHERE lookup_key IS NOT NULL")).scalar(), 1)
+        indexes = set(ix["name"] for ix in sqlalchemy.inspect(self.ds.dbengine).get_indexes("access_requests"))
+        self.assertIn("ix_access_requests_timestamp", indexes)
+        # only the unique index for the lookups is kept
+        self.assertIn("ix_access_requests_lookup_key", indexes)
+        self.assertNotIn("ix_access_requests_host_subject", indexes)
+
+        # and turning hashed_keys off swaps the unique indexes back
+        self.ds.dbengine.dispose()
+        self.ds.initialize({"sql.url": "sqlite:///" + path})
+        self.ds.store_access_request("host", "test@example.com", 4.0, "newest")
+        self.assertEqual(self.ds.get_access_request("host", "test@example.com")[3], "newest")
+        indexes = sqlalchemy.inspect(self.ds.dbengine).get_indexes("access_requests")
+        self.assertEqual(
+            sorted((ix["name"], bool(ix["unique"])) for ix in indexes),
+            [("ix_access_requests_host_subject", True), ("ix_access_requests_timestamp", False)])
+
+    def test_threads(self):
+        import threading
+
+        errors = []
+
+        def work(i):
+            subject = "test{}@example.com".format(i)
+            for j in range(10):
+                try:
+                    self.ds.store_access_request("host", subject, float(j), str(j))
+                    if self.ds.get_access_request("host", subject)[3] != str(j):
+                        errors.append((subject, j))
+                except Exception as ex:
+                    errors.append(ex)
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+        stats = self.ds.stats()
+        self.assertGreaterEqual(stats["checkouts"], 80)
+        self.assertEqual(stats["checked_out"], 0)
+        self.assertLessEqual(stats["connects"], 4)
+
+
 #class EMailAuthPluginTest(unittest.TestCase):
     #def setUp(self):
         #self.defaults_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "defaults")
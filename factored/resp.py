@@ -0,0 +1,241 @@
+"""
+A minimal client for the Redis protocol (RESP), enough for the
+RedisDataStore plugin without depending on a Redis client library.
+"""
+from contextlib import contextmanager
+import socket
+import threading
+
+import logging
+logger = logging.getLogger('factored.resp')
+
+
+class RESPError(Exception):
+    """
+    an error reply from the server
+    """
+    pass
+
+
+def encode_command(args):
+    """
+    Arguments:
+    args -- the command and its arguments, IE ("GET", "key")
+
+    Returns:
+    the command encoded as a RESP array of bulk strings
+    """
+    out = [b"*", str(len(args)).encode("ascii"), b"\r\n"]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        elif isinstance(arg, float):
+            data = repr(arg).encode("ascii")
+        else:
+            data = str(arg).encode("utf-8")
+        out.extend((b"$", str(len(data)).encode("ascii"), b"\r\n", data, b"\r\n"))
+    return b"".join(out)
+
+
+def read_reply(rfile):
+    """
+    Arguments:
+    rfile -- buffered binary file of the connection
+
+    Returns:
+    the next reply, with bulk strings as bytes and error replies as (not
+    raised) RESPErrors
+    """
+    line = rfile.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("connection closed by the server")
+    kind, value = line[:1], line[1:-2]
+    if kind == b"+":
+        return value.decode("utf-8")
+    if kind == b"-":
+        return RESPError(value.decode("utf-8"))
+    if kind == b":":
+        return int(value)
+    if kind == b"$":
+        length = int(value)
+        if length < 0:
+            return None
+        data = rfile.read(length + 2)
+        if len(data) != length + 2:
+            raise ConnectionError("connection closed by the server")
+        return data[:-2]
+    if kind == b"*":
+        length = int(value)
+        if length < 0:
+            return None
+        return [read_reply(rfile) for _ in range(length)]
+    raise ConnectionError("unexpected reply from the server: {!r}".format(line))
+
+
+class RESPClient(object):
+    """
+    RESPClient keeps up to pool_size connections to a Redis server open for
+    reuse, and sends commands one at a time or pipelined. A call on a reused
+    connection the server closed before replying is retried once on a new
+    connection.
+    """
+    def __init__(self, host="localhost", port=6379, db=0, password=None,
+                 unix_socket=None, pool_size=4, timeout=5):
+        """
+        Keyword Arguments:
+        host -- host of the server
+        port -- port of the server
+        db -- number of the database selected on every connection
+        password -- password to AUTH with, if any
+        unix_socket -- path of the server's Unix socket, used instead of
+                       host and port if given
+        pool_size -- maximum number of idle connections kept open
+        timeout -- seconds to wait on the server
+        """
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.unix_socket = unix_socket
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.connects = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def connect(self):
+        if self.unix_socket is not None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            address = self.unix_socket
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            address = (self.host, self.port)
+        sock.settimeout(self.timeout)
+        conn = (sock, sock.makefile("rb"))
+        try:
+            sock.connect(address)
+            setup = []
+            if self.password:
+                setup.append(("AUTH", self.password))
+            if self.db:
+                setup.append(("SELECT", self.db))
+            if setup:
+                self._check(self._request(conn, setup))
+        except Exception:
+            self.discard(conn)
+            raise
+        with self._lock:
+            self.connects += 1
+        return conn
+
+    def _request(self, conn, commands):
+        sock, rfile = conn
+        sock.sendall(b"".join(encode_command(c) for c in commands))
+        replies = []
+        try:
+            for _ in commands:
+                replies.append(read_reply(rfile))
+        except ConnectionError:
+            if replies:
+                # the server got at least some of the commands
+                raise IOError("connection lost after {} replies".format(len(replies)))
+            raise
+        return replies
+
+    def _check(self, replies):
+        # errors can be nested, IE in the replies EXEC returns for the
+        # commands of a transaction
+        for reply in replies:
+            if isinstance(reply, RESPError):
+                raise reply
+            if isinstance(reply, list):
+                self._check(reply)
+        return replies
+
+    @contextmanager
+    def connection(self):
+        """
+        Yields a function that sends a list of commands, like pipeline, on
+        the same connection every time, for commands that depend on the
+        state of the connection, IE WATCH and MULTI. Watched keys are
+        unwatched before the connection is reused.
+        """
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self.connect()
+        try:
+            yield lambda commands: self._check(self._request(conn, commands))
+            self._check(self._request(conn, [("UNWATCH",)]))
+        except Exception:
+            self.discard(conn)
+            raise
+        self.release(conn)
+
+    def pipeline(self, commands):
+        """
+        Arguments:
+        commands -- list of commands, each a tuple of the command and its
+                    arguments, sent together in one round trip
+
+        Returns:
+        list of the replies to the commands
+
+        Raises:
+        RESPError for the first command the server replied to with an error
+        """
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        try:
+            if conn is None:
+                conn = self.connect()
+                replies = self._request(conn, commands)
+            else:
+                try:
+                    replies = self._request(conn, commands)
+                except ConnectionError:
+                    # the server closed the idle connection before getting the
+                    # commands, a timeout isn't retried since they might have run
+                    self.discard(conn)
+                    conn = self.connect()
+                    replies = self._request(conn, commands)
+        except Exception:
+            if conn is not None:
+                self.discard(conn)
+            raise
+        self.release(conn)
+        return self._check(replies)
+
+    def execute(self, *args):
+        """
+        Arguments:
+        args -- the command and its arguments
+
+        Returns:
+        the reply to the command
+
+        Raises:
+        RESPError if the server replied with an error
+        """
+        return self.pipeline([args])[0]
+
+    def release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        self.discard(conn)
+
+    def discard(self, conn):
+        for f in reversed(conn):
+            try:
+                f.close()
+            except Exception:
+                pass
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self.discard(conn)
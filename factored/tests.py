@@ -1,8 +1,10 @@
+import smtplib
+import time
 import unittest
 
 from pyramid import testing
 
-from factored.plugins import get_plugin_settings
+from factored.plugins import get_plugin_settings, SettingsIndex
 
 
 class PluginManagementTests(unittest.TestCase):
@@ -28,3 +30,361 @@ class PluginManagementTests(unittest.TestCase):
         self.assertIsNotNone(psettings)
         self.assertIn("valid_domains", psettings)
         self.assertNotIn("plugins.dirs", psettings)
+
+    def test_settings_index(self):
+        index = SettingsIndex(self.config.registry.settings)
+        psettings = get_plugin_settings("plugins.finder", index)
+        self.assertEqual(psettings, get_plugin_settings("plugins.finder", self.config.registry.settings))
+
+        layered = index.layer({
+            'plugins.finder': 'other',
+            'plugin.emaildomain.valid_domains': 'example.com',
+            'plugin.other.enabled': 'true',
+        })
+        self.assertEqual(layered["plugins.dirs"], '/app/factored/plugins/')
+        self.assertEqual(layered.namespace("plugin.emaildomain."), {'valid_domains': 'example.com'})
+        self.assertEqual(get_plugin_settings("plugins.finder", layered), {'enabled': 'true'})
+        self.assertEqual(layered.namespace("plugin.emaildomain.valid"), {'_domains': 'example.com'})
+
+        # the app settings are left alone
+        self.assertEqual(index.namespace("plugin.emaildomain.")["valid_domains"],
+                         'wildcardcorp.com\n   assemblys.net')
+
+
+class PluginResolverTests(unittest.TestCase):
+    def setUp(self):
+        from factored.plugins import get_manager, PluginResolver
+
+        self.settings = {
+            'plugins.finder': 'EMailDomain',
+            'plugin.EMailDomain.valid_domains': 'wildcardcorp.com',
+        }
+        self.resolver = PluginResolver(get_manager(), self.settings)
+
+    def test_get_plugin_cached(self):
+        p, psettings = self.resolver.get_plugin("plugins.finder", "finder", self.settings)
+        self.assertIsNotNone(p)
+        self.assertEqual(psettings, {'valid_domains': 'wildcardcorp.com'})
+
+        cached = self.resolver.get_plugin("plugins.finder", "finder", self.settings)
+        self.assertIs(cached[0], p)
+        self.assertEqual(len(self.resolver._plugins), 1)
+
+        # changing the settings a plugin was given doesn't change the cache
+        cached[1]["valid_domains"] = "changed.com"
+        cached[1].setdefault("extra", "value")
+        _, psettings = self.resolver.get_plugin("plugins.finder", "finder", self.settings)
+        self.assertEqual(psettings, {'valid_domains': 'wildcardcorp.com'})
+
+    def test_max_hosts(self):
+        from factored.plugins import get_manager, PluginResolver
+
+        self.settings["plugins.resolver.max_hosts"] = "2"
+        resolver = PluginResolver(get_manager(), self.settings)
+        for i in range(5):
+            settings = resolver.settings.layer({'plugin.EMailDomain.valid_domains': str(i)})
+            resolver.track("host{}.example.com".format(i), settings)
+            resolver.get_plugin("plugins.finder", "finder", settings)
+        self.assertEqual(list(resolver._hosts), ["host3.example.com", "host4.example.com"])
+        # the entries of hosts that were dropped are released too
+        self.assertEqual(len(resolver._refs), 2)
+        self.assertEqual(len(resolver._plugins), 2)
+
+    def test_request_settings_change(self):
+        overrides = {'plugin.EMailDomain.valid_domains': 'assemblys.net'}
+        settings = self.resolver.settings.layer(overrides)
+
+        fingerprint = self.resolver.track("example.com", settings)
+        _, psettings = self.resolver.get_plugin("plugins.finder", "finder", settings)
+        self.assertEqual(psettings["valid_domains"], 'assemblys.net')
+        same = self.resolver.settings.layer(dict(overrides))
+        self.assertEqual(fingerprint, self.resolver.track("example.com", same))
+
+        # once the host's settings change, the old entries are dropped
+        self.assertIsNone(self.resolver.track("example.com", self.resolver.settings))
+        self.assertEqual(self.resolver._plugins, {})
+
+    def test_layered_settings_copy_on_write(self):
+        overrides = {'plugin.EMailDomain.valid_domains': 'assemblys.net'}
+        settings = self.resolver.settings.layer(overrides)
+        self.assertEqual(hash(settings), hash(self.resolver.settings.layer(dict(overrides))))
+
+        fingerprint = settings.fingerprint
+        settings['plugins.finder'] = 'Other'
+        self.assertNotEqual(settings.fingerprint, fingerprint)
+        self.assertEqual(overrides, {'plugin.EMailDomain.valid_domains': 'assemblys.net'})
+        self.assertEqual(self.settings['plugins.finder'], 'EMailDomain')
+
+
+class TTLCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+
+    def clock(self):
+        return self.now
+
+    def test_expiry(self):
+        from factored.cache import TTLCache
+
+        cache = TTLCache(max_size=10, ttl=5, clock=self.clock)
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=20)
+        self.assertEqual(cache.get("a"), 1)
+        self.now += 10
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), 2)
+        self.assertEqual(cache.stats(), dict(hits=2, misses=1, evictions=0, size=1))
+
+    def test_lru_eviction(self):
+        from factored.cache import TTLCache
+
+        cache = TTLCache(max_size=2, ttl=5, clock=self.clock)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.evictions, 1)
+
+        cache.invalidate("a")
+        self.assertNotIn("a", cache)
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+
+class CachedSettingsPluginTests(unittest.TestCase):
+    def test_cached_until_invalidated(self):
+        from factored.plugins import CachedSettingsPlugin, ISettingsPlugin
+
+        class CountingSettings(ISettingsPlugin):
+            calls = 0
+
+            def get_request_settings(self, host):
+                self.calls += 1
+                return {"jwt.audience": host}
+
+        plugin = CountingSettings()
+        cached = CachedSettingsPlugin(plugin, ttl=60, max_size=10)
+        self.assertEqual(cached.get_request_settings("a.example.com"), {"jwt.audience": "a.example.com"})
+        cached.get_request_settings("a.example.com")
+        self.assertEqual(plugin.calls, 1)
+
+        plugin.invalidate_request_settings("a.example.com")
+        cached.get_request_settings("a.example.com")
+        self.assertEqual(plugin.calls, 2)
+
+
+class FakeSMTP(object):
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+
+    def ehlo(self):
+        return (250, b"fake")
+
+    def has_extn(self, name):
+        return False
+
+    def sendmail(self, fromaddr, toaddrs, message):
+        if self.server.failures > 0:
+            self.server.failures -= 1
+            raise self.server.error
+        self.server.sent.append((fromaddr, toaddrs))
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSMTPMailer(object):
+    force_tls = False
+    no_tls = True
+    username = None
+    password = None
+
+    def __init__(self):
+        self.connections = []
+        self.failures = 0
+        self.error = smtplib.SMTPServerDisconnected("dropped")
+        self.sent = []
+
+    def smtp_factory(self):
+        connection = FakeSMTP(self)
+        self.connections.append(connection)
+        return connection
+
+
+class MailDeliveryTests(unittest.TestCase):
+    def setUp(self):
+        from pyramid_mailer.mailer import Mailer
+        from pyramid_mailer.message import Message
+
+        self.smtp = FakeSMTPMailer()
+        self.mailer = Mailer(smtp_mailer=self.smtp)
+        self.message = lambda: Message(
+            subject="code", sender="factored@example.com",
+            recipients=["test@example.com"], body="1234")
+
+    def test_pool_reuses_connections(self):
+        from factored.mail import SMTPConnectionPool
+
+        pool = SMTPConnectionPool(self.smtp, size=1)
+        for _ in range(3):
+            pool.send("factored@example.com", ["test@example.com"], self.message().to_message())
+        self.assertEqual(len(self.smtp.connections), 1)
+
+        # a connection the server dropped is replaced
+        self.smtp.failures = 1
+        pool.send("factored@example.com", ["test@example.com"], self.message().to_message())
+        self.assertEqual(len(self.smtp.connections), 2)
+        self.assertEqual(len(self.smtp.sent), 4)
+        pool.close()
+        self.assertTrue(self.smtp.connections[-1].closed)
+
+    def test_retry(self):
+        from factored.cache import TTLCache
+        from factored.mail import DeliveryQueue, SENT
+
+        statuses = TTLCache()
+        delivery = DeliveryQueue(self.mailer, statuses, workers=1, retries=3, retry_delay=0.01)
+        # fails on a new connection, then again on its retry's new connection
+        self.smtp.failures = 2
+        delivery_id = delivery.submit(self.message())
+        for _ in range(200):
+            if statuses.get(delivery_id) == SENT:
+                break
+            time.sleep(0.01)
+        delivery.close(timeout=1)
+        self.assertEqual(statuses.get(delivery_id), SENT)
+        self.assertEqual(len(self.smtp.sent), 1)
+
+    def test_retry_transient(self):
+        from pyramid_mailer.mailer import Mailer
+        from factored.cache import TTLCache
+        from factored.mail import DeliveryQueue, FAILED, SENT
+
+        errors = [
+            (smtplib.SMTPResponseException(451, b"try again later"), SENT),
+            (smtplib.SMTPRecipientsRefused({"test@example.com": (452, b"mailbox full")}), SENT),
+            (smtplib.SMTPResponseException(554, b"rejected"), FAILED),
+            (smtplib.SMTPSenderRefused(553, b"bad sender", "factored@example.com"), FAILED),
+            (smtplib.SMTPRecipientsRefused({"test@example.com": (550, b"no such user")}), FAILED),
+            (ValueError("bad message"), FAILED),
+        ]
+        for error, status in errors:
+            smtp = FakeSMTPMailer()
+            smtp.error = error
+            smtp.failures = 1
+            statuses = TTLCache()
+            delivery = DeliveryQueue(Mailer(smtp_mailer=smtp), statuses, workers=1, retries=3,
+                                     retry_delay=0.01)
+            delivery_id = delivery.submit(self.message())
+            for _ in range(200):
+                if statuses.get(delivery_id) in (SENT, FAILED):
+                    break
+                time.sleep(0.01)
+            delivery.close(timeout=1)
+            self.assertEqual(statuses.get(delivery_id), status, error)
+            # a permanent failure isn't sent again
+            self.assertEqual(len(smtp.connections), 2 if status == SENT else 1, error)
+
+    def test_queue_full(self):
+        from factored.cache import TTLCache
+        from factored.mail import DeliveryQueue, DeliveryQueueFull, QUEUED
+
+        statuses = TTLCache()
+        delivery = DeliveryQueue(self.mailer, statuses, workers=0, queue_size=1)
+        delivery_id = delivery.submit(self.message())
+        self.assertEqual(statuses.get(delivery_id), QUEUED)
+        self.assertRaises(DeliveryQueueFull, delivery.submit, self.message())
+
+    def test_mailer_registry(self):
+        from factored.mail import MailerRegistry
+
+        registry = MailerRegistry()
+        mailer = registry.get_mailer({"mail.host": "smtp.example.com", "mail.port": " 25", "mail.tls": "True"})
+        self.assertIs(mailer, registry.get_mailer({"mail.host": "smtp.example.com", "mail.port": "25", "mail.tls": "true"}))
+        self.assertIsNot(mailer, registry.get_mailer({"mail.host": "other.example.com"}))
+        sendmail = registry.get_mailer({"mail.host": "smtp.example.com", "mail.sendmail_app": "/usr/sbin/sendmail"})
+        self.assertIsNot(sendmail, registry.get_mailer({"mail.host": "smtp.example.com", "mail.sendmail_app": "/bin/sendmail"}))
+        self.assertEqual(sendmail.sendmail_mailer.sendmail_app, "/usr/sbin/sendmail")
+
+        mailer.pool.smtp_mailer = self.smtp
+        for _ in range(3):
+            mailer.send_immediately(self.message())
+        stats = registry.stats()
+        self.assertEqual(stats["mailers"], 4)
+        self.assertEqual(stats["reused"], 1)
+        self.assertEqual(stats["connects"], 1)
+        self.assertEqual(stats["reuses"], 2)
+        self.assertEqual(len(self.smtp.sent), 3)
+        registry.close()
+
+    def test_delivery_queue_key(self):
+        from factored.mail import _delivery_queues, get_delivery_queue
+
+        settings = {"mail.host": "queue.example.com", "mail.port": "25", "mail.async.workers": "0"}
+        delivery = get_delivery_queue(settings)
+        try:
+            # equivalent settings share the queue, and its mailer
+            same = dict(settings, **{"mail.port": " 25", "mail.unknown": "x"})
+            self.assertIs(delivery, get_delivery_queue(same))
+            other = get_delivery_queue(dict(settings, **{"mail.queue_path": "/var/spool/factored"}))
+            self.assertIsNot(delivery, other)
+            self.assertIsNot(delivery.mailer, other.mailer)
+        finally:
+            for key in [k for k, v in _delivery_queues.items()
+                        if v.mailer.smtp_mailer.hostname == "queue.example.com"]:
+                _delivery_queues.pop(key).close(timeout=1)
+
+    def test_delivery_queues_bounded(self):
+        from factored import mail
+
+        queues = [mail.get_delivery_queue({"mail.host": "queue{}.example.com".format(i)})
+                  for i in range(mail.MAX_DELIVERY_QUEUES + 2)]
+        try:
+            self.assertEqual(len(mail._delivery_queues), mail.MAX_DELIVERY_QUEUES)
+            # the least recently used queues are closed, and their workers stop
+            for queue in queues[:2]:
+                for worker in queue._workers:
+                    worker.join(1)
+                    self.assertFalse(worker.is_alive())
+                self.assertTrue(queue.closed)
+            self.assertFalse(queues[2].closed)
+        finally:
+            mail.close_delivery_queues(timeout=1)
+        self.assertEqual(len(mail._delivery_queues), 0)
+        self.assertTrue(all(queue.closed for queue in queues))
+
+
+class PluginExecutorTests(unittest.TestCase):
+    def test_run(self):
+        import hashlib
+        from factored.plugins import PluginExecutor
+
+        for kind in ("inline", "thread", "process"):
+            executor = PluginExecutor(kind=kind, workers=1)
+            self.assertEqual(
+                executor.run(hashlib.pbkdf2_hmac, "sha256", b"code", b"salt", 10),
+                hashlib.pbkdf2_hmac("sha256", b"code", b"salt", 10))
+            executor.shutdown()
+
+    def test_busy(self):
+        import threading
+        from factored.plugins import ExecutorBusy, PluginExecutor
+
+        executor = PluginExecutor(kind="thread", workers=1, max_pending=1, timeout=0.05)
+        release = threading.Event()
+        future = executor.submit(release.wait)
+        self.assertRaises(ExecutorBusy, executor.submit, release.wait)
+        release.set()
+        future.result()
+        self.assertEqual(executor.stats()["rejected"], 1)
+
+        # a slow result times out rather than holding the request
+        self.assertRaises(ExecutorBusy, executor.run, time.sleep, 0.5)
+        self.assertEqual(executor.stats()["timeouts"], 1)
+        executor.shutdown()
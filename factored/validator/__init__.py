@@ -1,9 +1,15 @@
+import base64
+import hashlib
+import json
+import time
+
 import jwt
 from pyramid.config import Configurator
 from pyramid.response import Response
 from pyramid.view import view_config
 
-from factored.plugins import get_manager, get_plugin
+from factored.cache import TTLCache
+from factored.plugins import get_manager, get_resolver, PluginResolver
 
 import logging
 logger = logging.getLogger('factored.validator')
@@ -50,6 +56,87 @@ def log_info(req, msg, subject=None, exc_info=False, normal=True, audit=False):
             logger.error("fatal error while logging to audit log")
 
 
+def _get_cache(settings, name, ttl_setting, ttl_default, size_setting, size_default):
+    cache = settings.get(name, None)
+    if cache is None:
+        try:
+            ttl = int(settings.get(ttl_setting, ttl_default))
+            max_size = int(settings.get(size_setting, size_default))
+        except Exception:
+            logger.error("failed to get {} or {} config".format(ttl_setting, size_setting),
+                         exc_info=True)
+            ttl = ttl_default
+            max_size = size_default
+        cache = TTLCache(max_size=max_size, ttl=ttl)
+        settings[name] = cache
+    return cache
+
+
+def get_token_cache(settings):
+    """
+    Arguments:
+    settings -- the app settings
+
+    Returns:
+    the TTLCache of validated tokens for the app, created and stored as
+    "validator.token_cache" in settings if the app didn't already set one up.
+    Entries live for at most "validator.cache.max_age" seconds (default 30,
+    0 disables the cache), and at most "validator.cache.max_size" (default
+    10000) tokens are kept.
+    """
+    return _get_cache(
+        settings, "validator.token_cache",
+        "validator.cache.max_age", 30,
+        "validator.cache.max_size", 10000)
+
+
+def get_rejected_token_cache(settings):
+    """
+    Arguments:
+    settings -- the app settings
+
+    Returns:
+    the TTLCache of rejected tokens for the app, created and stored as
+    "validator.rejected_token_cache" in settings if the app didn't already set
+    one up. Entries live for "validator.cache.negative_ttl" seconds (default
+    5, 0 disables the cache), and at most "validator.cache.negative_max_size"
+    (default 10000) tokens are kept.
+    """
+    return _get_cache(
+        settings, "validator.rejected_token_cache",
+        "validator.cache.negative_ttl", 5,
+        "validator.cache.negative_max_size", 10000)
+
+
+def precheck_token(enctoken, algo, max_length=8192):
+    """
+    Cheap structural checks of a token, to reject garbage before it gets to
+    the (much more expensive) jwt.decode.
+
+    Arguments:
+    enctoken -- the encoded jwt
+    algo -- the algorithm tokens are expected to be signed with
+
+    Keyword Arguments:
+    max_length -- the longest token that is accepted
+
+    Returns:
+    None if the token might be valid, otherwise a string describing the problem
+    """
+    if len(enctoken) > max_length:
+        return "token too long"
+    if enctoken.count(".") != 2:
+        return "malformed token"
+    header = enctoken[:enctoken.index(".")]
+    try:
+        header = json.loads(base64.urlsafe_b64decode(header + "=" * (-len(header) % 4)))
+    except Exception:
+        return "malformed token header"
+    if not isinstance(header, dict) or header.get("alg", None) != algo:
+        return "unexpected token algorithm"
+    return None
+
+
 #
 # All this view is responsible for is validating that a JWT value is valid
 # and that the subject it references is valid.
@@ -67,14 +154,16 @@ def validate(req):
         log_err(req, "plugin manager not configured")
         return Response(status=500)
 
-    sp, sp_settings = get_plugin("plugins.settings", "settings", reqsettings, plugin_manager)
+    resolver = get_resolver(reqsettings)
+    sp, sp_settings = resolver.get_plugin("plugins.settings", "settings", reqsettings)
 
-    settings = {}
-    settings.update(req.registry.settings)
+    request_settings = {}
     if sp is not None:
-        settings.update(sp.plugin_object.get_request_settings(host))
+        request_settings = resolver.get_request_settings(sp, host)
+    settings = resolver.settings.layer(request_settings)
+    resolver.track(host, settings)
 
-    finder, finder_settings = get_plugin("plugins.finder", "finder", settings, plugin_manager)
+    finder, finder_settings = resolver.get_plugin("plugins.finder", "finder", settings)
 
     # -- VALIDATE TOKEN
     cookiename = settings.get("jwt.cookie.name", "factored")
@@ -98,6 +187,32 @@ def validate(req):
         log_info(req, "secret not configured")
         return Response(status=403)
 
+    # tokens that were recently validated or rejected for the same host and
+    # settings don't need to be decoded or have their subject checked again
+    token_cache = get_token_cache(reqsettings)
+    rejected_cache = get_rejected_token_cache(reqsettings)
+    cache_key = (
+        host,
+        settings.fingerprint,
+        hashlib.sha256(enctoken.encode("utf-8")).digest())
+    if token_cache.get(cache_key, None) is not None:
+        log_info(req, "validated", normal=False, audit=True)
+        return Response(status=200)
+    if rejected_cache.get(cache_key, None) is not None:
+        logger.debug("rejected token seen again")
+        return Response(status=403)
+
+    try:
+        max_length = int(settings.get("jwt.max_length", 8192))
+    except Exception:
+        logger.error("failed to get jwt.max_length config", exc_info=True)
+        max_length = 8192
+    problem = precheck_token(enctoken, algo, max_length=max_length)
+    if problem is not None:
+        log_info(req, problem, audit=True)
+        rejected_cache.set(cache_key, problem)
+        return Response(status=403)
+
     try:
         dectoken = jwt.decode(
             enctoken,
@@ -106,23 +221,33 @@ def validate(req):
             algorithms=[algo])
     except jwt.exceptions.ExpiredSignatureError:
         log_info(req, "expired signature", audit=True)
+        rejected_cache.set(cache_key, "expired signature")
         return Response(status=403)
     except Exception:
         log_err(req, "JWT Decode ERROR", exc_info=True, audit=True)
+        rejected_cache.set(cache_key, "decode error")
         return Response(status=403)
 
     subject = dectoken.get('sub', None)
     if subject is None:
+        rejected_cache.set(cache_key, "no subject")
         return Response(status=403)
 
     # -- VALIDATE TOKEN SUBJECT
-    if not finder.plugin_object.is_valid_subject(host, subject):
+    if not resolver.get_finder(finder, finder_settings).is_valid_subject(host, subject):
         msg = "{findername} : {subject} : not valid".format(
             findername=finder.name,
             subject=subject)
         log_info(req, msg, audit=True)
         return Response(status=403)
 
+    # never cache a token past its expiration
+    ttl = token_cache.ttl
+    exp = dectoken.get('exp', None)
+    if exp is not None:
+        ttl = min(ttl, exp - time.time())
+    token_cache.set(cache_key, subject, ttl=ttl)
+
     log_info(req, "validated", normal=False, audit=True)
     return Response(status=200)
 
@@ -138,21 +263,23 @@ def status(req):
         return Response(status=500)
 
     # check that we can get all the appropriate settings
-    sp, _ = get_plugin("plugins.settings", "settings", reqsettings, plugin_manager)
-    settings = {}
-    settings.update(req.registry.settings)
+    resolver = get_resolver(reqsettings)
+    sp, _ = resolver.get_plugin("plugins.settings", "settings", reqsettings)
     if sp is None:
         log_err(req, "no settings plugin found")
         return Response(status=500)
     else:
         try:
-            settings.update(sp.plugin_object.get_request_settings(host))
+            # bypass the cache, the status should reflect the settings plugin
+            request_settings = sp.plugin_object.get_request_settings(host)
         except Exception:
             log_err(req, "couldn't fetch settings through settings plugin", exc_info=True)
             return Response(status=500)
+        settings = resolver.settings.layer(request_settings)
+        resolver.track(host, settings)
 
     # check we can get the finder
-    finder, _ = get_plugin("plugins.finder", "finder", settings, plugin_manager)
+    finder, _ = resolver.get_plugin("plugins.finder", "finder", settings)
     if finder is None:
         log_err(req, "no finder plugin found")
         return Response(status=500)
@@ -180,6 +307,10 @@ def app(global_config, **settings):
 
     # setup wsgi app
     config = Configurator(settings=settings)
+    config.registry.settings["plugins.resolver"] = PluginResolver(
+        plugins, config.registry.settings)
+    get_token_cache(config.registry.settings)
+    get_rejected_token_cache(config.registry.settings)
     config.add_route('validate', '/')
     config.add_route('status', '/validator-status')
     config.scan('factored.validator')
@@ -27,6 +27,9 @@ setup(
         'test':[
             'pytest',
         ],
+        'brotli':[
+            'brotli',
+        ],
     },
     entry_points={
         "paste.app_factory": [
@@ -34,5 +37,6 @@ setup(
             "authenticator_main = factored.authenticator:app",
         ],
         "console_scripts": [
+            "factored_kvstore = factored.kvstore:main",
         ],
     })